@@ -91,6 +91,23 @@ REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
+# Cache of computed stats (apps/common/cache.py). "local" keeps a size
+# bounded LRU with a TTL in each process, "django" uses the CACHES entry
+# named by CACHE_ALIAS so processes can share it. With "local" (or a
+# per-process CACHES entry such as the default locmem one), a write only
+# invalidates the entries of the process that handled it: with several
+# workers, the others can serve stale stats for up to TIMEOUT seconds.
+# Multi-worker deployments should use "django" with a shared cache
+# (memcached, redis...). Concurrent misses of the same entry wait up to
+# FLIGHT_TIMEOUT seconds for a single computation.
+STATS_CACHE = {
+    "BACKEND": config("STATS_CACHE_BACKEND", default="local"),
+    "CACHE_ALIAS": "default",
+    "MAX_ENTRIES": 10000,
+    "TIMEOUT": 300,
+    "FLIGHT_TIMEOUT": 10,
+}
+
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = config("EMAIL_HOST")
 EMAIL_PORT = config("EMAIL_PORT")
@@ -0,0 +1,102 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from apps.common.models import uuid7
+
+KEY_FUNCTIONS = {
+    "uuid4": uuid.uuid4,
+    "uuid7": uuid7,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare insert throughput and primary key index size of random (v4) "
+        "and time-ordered (v7) UUID keys on scratch tables"
+    )
+
+    rows_per_statement = 500
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        for name, new_key in KEY_FUNCTIONS.items():
+            table = f"benchmark_user_ids_{name}"
+            self.create_table(table)
+            try:
+                seconds, last_batch_rate = self.insert(
+                    table, new_key, options["rows"], options["batch_size"]
+                )
+                index_size = self.index_size(table)
+            finally:
+                self.drop_table(table)
+
+            size = f"{index_size / 1024 ** 2:.1f} MB" if index_size is not None else "n/a"
+            self.stdout.write(
+                f"{name}: {options['rows']} rows in {seconds:.1f}s "
+                f"({options['rows'] / seconds:.0f} rows/s, last batch {last_batch_rate:.0f} rows/s), "
+                f"primary key index {size}"
+            )
+
+    def create_table(self, table):
+        key_type = connection.data_types["UUIDField"]
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {connection.ops.quote_name(table)}")
+            cursor.execute(
+                f"CREATE TABLE {connection.ops.quote_name(table)} "
+                f"(id {key_type} PRIMARY KEY, seq integer NOT NULL)"
+            )
+
+    def drop_table(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {connection.ops.quote_name(table)}")
+
+    def insert(self, table, new_key, rows, batch_size):
+        field = models.UUIDField()
+        sql = f"INSERT INTO {connection.ops.quote_name(table)} (id, seq) VALUES "
+        started = time.monotonic()
+        last_batch_rate = 0.0
+        with connection.cursor() as cursor:
+            for start in range(0, rows, batch_size):
+                batch = [
+                    (field.get_db_prep_value(new_key(), connection), seq)
+                    for seq in range(start, min(start + batch_size, rows))
+                ]
+                batch_started = time.monotonic()
+                with transaction.atomic():
+                    # multi-row statements, so the time is spent in the database
+                    # rather than on one round trip per row
+                    for offset in range(0, len(batch), self.rows_per_statement):
+                        chunk = batch[offset : offset + self.rows_per_statement]
+                        cursor.execute(
+                            sql + ", ".join(["(%s, %s)"] * len(chunk)),
+                            [value for row in chunk for value in row],
+                        )
+                last_batch_rate = len(batch) / max(time.monotonic() - batch_started, 1e-9)
+        return time.monotonic() - started, last_batch_rate
+
+    def index_size(self, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT pg_relation_size(indexrelid) FROM pg_index "
+                    "WHERE indrelid = %s::regclass AND indisprimary",
+                    [table],
+                )
+                return cursor.fetchone()[0]
+            if connection.vendor == "sqlite":
+                try:
+                    cursor.execute(
+                        "SELECT SUM(pgsize) FROM dbstat WHERE name = %s",
+                        [f"sqlite_autoindex_{table}_1"],
+                    )
+                except Exception:
+                    # SQLite builds without the dbstat virtual table
+                    return None
+                return cursor.fetchone()[0]
+        return None
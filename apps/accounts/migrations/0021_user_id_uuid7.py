@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 19:26
+
+import apps.common.models
+from apps.common.models import uuid7
+from django.db import migrations, models
+
+
+def rekey_users(apps, schema_editor):
+    """
+    Give existing users a UUIDv7 built from their signup time, so old and
+    new ids share one ordering, and move every foreign key pointing at them.
+    Foreign keys are created deferrable, so they are only checked at commit.
+    """
+    User = apps.get_model("accounts", "User")
+    references = [
+        (model, field.attname)
+        for model in apps.get_models(include_auto_created=True)
+        for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model == User
+    ]
+    users = User.objects.order_by("created_at").values_list("pk", "created_at")
+    for old_id, created_at in users.iterator():
+        new_id = uuid7(int(created_at.timestamp() * 1000))
+        for model, attname in references:
+            model._base_manager.filter(**{attname: old_id}).update(**{attname: new_id})
+        User._base_manager.filter(pk=old_id).update(id=new_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0020_alter_user_id'),
+        ('expenses', '0014_public_ids'),
+        ('user_stats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='id',
+            field=models.UUIDField(default=apps.common.models.uuid7, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.RunPython(rekey_users, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
-import uuid
 
+from apps.common.models import uuid7
 from .managers import CustomUserManager 
 
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -13,7 +13,9 @@ AUTH_PROVIDERS = {
 }
 
 class User(AbstractBaseUser, PermissionsMixin):
-    id = models.UUIDField(default=uuid.uuid4(), unique=True, primary_key=True)
+    # time-ordered, so new users are appended to the end of the primary key
+    # and owner foreign key indexes instead of landing on random pages
+    id = models.UUIDField(default=uuid7, unique=True, primary_key=True)
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     email = models.EmailField(_('Email Address'), unique=True)
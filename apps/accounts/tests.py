@@ -0,0 +1,27 @@
+from django.test import TestCase
+
+from apps.accounts.models import User
+from apps.common.models import uuid7
+
+
+class UserIdTests(TestCase):
+    def create_user(self, email):
+        return User.objects.create_user(
+            first_name="test", last_name="user", email=email, password="testuser"
+        )
+
+    def test_each_user_gets_a_new_time_ordered_id(self):
+        first = self.create_user("first@mail.com")
+        second = self.create_user("second@mail.com")
+
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(first.pk.version, 7)
+        self.assertLessEqual(first.pk.bytes[:6], second.pk.bytes[:6])
+
+    def test_uuid7_layout(self):
+        value = uuid7(timestamp_ms=0x0123456789AB)
+
+        self.assertEqual(value.hex[:12], "0123456789ab")
+        self.assertEqual(value.version, 7)
+        self.assertEqual(value.variant, "specified in RFC 4122")
+        self.assertLess(uuid7(timestamp_ms=1), uuid7(timestamp_ms=2))
@@ -0,0 +1,135 @@
+"""
+Cache of computed stats, keyed per user by a data version.
+
+Every user has a version token, and cached entries are stored under the
+token current when they were computed. Any write to the user's expenses
+or categories replaces the token (see apps/user_stats/signals.py), so
+later reads miss and recompute instead of having to find and delete the
+stale entries, which simply age out. The token is random rather than a counter, so losing it
+to eviction can never bring an old entry back.
+
+Two backends are available, picked with settings.STATS_CACHE["BACKEND"]:
+"local", an LRU with a TTL per process, and "django", any configured
+Django cache (locmem, memcached, redis...). The version tokens live in the
+backend too, so invalidation only reaches every worker when the backend is
+shared; with a per-process one, other workers can serve stale entries
+until their TTL runs out.
+
+Concurrent misses of the same entry within a process are coalesced (see
+apps/common/singleflight.py): one thread computes, the others wait for it.
+"""
+import threading
+import uuid
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import caches
+
+from .singleflight import FlightTimeout, SingleFlight
+
+MISSING = object()
+
+
+class LocalBackend:
+    """Size-bounded LRU with a TTL, local to the process"""
+
+    def __init__(self, max_entries, timeout):
+        self.entries = TTLCache(maxsize=max_entries, ttl=timeout)
+        # TTLCache is not thread safe
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.entries.get(key, MISSING)
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+
+
+class DjangoCacheBackend:
+    def __init__(self, alias, timeout):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key, MISSING)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+
+class StatsCache:
+    def __init__(self, backend, flight_timeout=None):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # concurrent misses of the same entry are computed once
+        self.flights = SingleFlight()
+        self.flight_timeout = flight_timeout
+
+    def version_key(self, user_id):
+        return f"stats:version:{user_id}"
+
+    def get_version(self, user_id):
+        version = self.backend.get(self.version_key(user_id))
+        if version is MISSING:
+            version = self.bump(user_id)
+        return version
+
+    def bump(self, user_id):
+        version = uuid.uuid4().hex
+        self.backend.set(self.version_key(user_id), version)
+        return version
+
+    def get_or_compute(self, user_id, key, compute):
+        """
+        Return the cached value of `key` for the user's current data, calling
+        `compute` to fill it in on a miss
+        """
+        cache_key = f"stats:{user_id}:{self.get_version(user_id)}:{key}"
+        value = self.backend.get(cache_key)
+        if value is not MISSING:
+            self.count(hit=True)
+            return value
+        self.count(hit=False)
+
+        def compute_and_store():
+            value = compute()
+            self.backend.set(cache_key, value)
+            return value
+
+        try:
+            return self.flights.do(cache_key, compute_and_store, timeout=self.flight_timeout)
+        except FlightTimeout:
+            # the shared computation is taking too long, don't wait on it any longer
+            return compute_and_store()
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def info(self):
+        with self.lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": hits,
+            "misses": misses,
+            "coalesced": self.flights.coalesced,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+        }
+
+
+def get_backend():
+    options = settings.STATS_CACHE
+    if options["BACKEND"] == "django":
+        return DjangoCacheBackend(options["CACHE_ALIAS"], options["TIMEOUT"])
+    return LocalBackend(options["MAX_ENTRIES"], options["TIMEOUT"])
+
+
+stats_cache = StatsCache(get_backend(), flight_timeout=settings.STATS_CACHE["FLIGHT_TIMEOUT"])
@@ -1,7 +1,35 @@
 from django.db import models
+import os
+import secrets
+import time
 import uuid
 from autoslug import AutoSlugField
 
+
+def generate_public_id():
+    """
+    Random 64-bit id encoded as 11 URL-safe characters. Collisions are
+    left to the unique index rather than checked with a query first.
+    """
+    return secrets.token_urlsafe(8)
+
+
+
+def uuid7(timestamp_ms=None):
+    """
+    UUID version 7 (RFC 9562): a 48-bit Unix timestamp in milliseconds
+    followed by 74 random bits, so ids created later sort after earlier ones
+    and new rows are appended at the right edge of the primary key index.
+    """
+    if timestamp_ms is None:
+        timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    # set the version (7) and the RFC 4122 variant bits
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
+
+
 class BaseModel(models.Model):
     created_at = models.DateField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -0,0 +1,59 @@
+"""
+Request coalescing ("single flight") within a process.
+
+When several threads ask for the same key at the same time, the first one
+runs the computation and the others wait for its result instead of running
+it again. The result, or the exception, is handed to every waiter, and the
+key is forgotten as soon as the call finishes, so nothing is cached here.
+"""
+import threading
+
+
+class FlightTimeout(TimeoutError):
+    pass
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, compute, timeout=None):
+        """
+        Return compute() for `key`, sharing the call with any concurrent
+        caller of the same key. Waiters give up with FlightTimeout after
+        `timeout` seconds; the call itself keeps running.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = compute()
+            except BaseException as error:
+                call.error = error
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        elif not call.done.wait(timeout):
+            raise FlightTimeout(f"Timed out waiting for the computation of {key}")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
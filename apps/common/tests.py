@@ -1,3 +1,75 @@
-from django.test import TestCase
+import threading
+import time
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from apps.common.singleflight import FlightTimeout, SingleFlight
+
+
+class SingleFlightTests(SimpleTestCase):
+    def run_concurrently(self, count, target):
+        barrier = threading.Barrier(count)
+        results = []
+
+        def run():
+            barrier.wait()
+            try:
+                results.append(target())
+            except Exception as error:
+                results.append(error)
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_calls_share_one_computation(self):
+        flights = SingleFlight()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return "result"
+
+        results = self.run_concurrently(8, lambda: flights.do("key", compute))
+        self.assertEqual(results, ["result"] * 8)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flights.coalesced, 7)
+        self.assertEqual(flights.calls, {})
+
+    def test_errors_reach_every_waiter(self):
+        flights = SingleFlight()
+
+        def compute():
+            time.sleep(0.2)
+            raise ValueError("failed")
+
+        results = self.run_concurrently(4, lambda: flights.do("key", compute))
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        # a failed call is not remembered
+        self.assertEqual(flights.do("key", lambda: "retried"), "retried")
+
+    def test_waiters_time_out(self):
+        flights = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def compute():
+            started.set()
+            release.wait()
+            return "slow"
+
+        leader = threading.Thread(target=flights.do, args=("key", compute))
+        leader.start()
+        started.wait()
+        try:
+            with self.assertRaises(FlightTimeout):
+                flights.do("key", compute, timeout=0.05)
+            self.assertEqual(flights.do("other", lambda: "other"), "other")
+        finally:
+            release.set()
+            leader.join()
@@ -0,0 +1,99 @@
+"""
+Limit windows of periodic budgets.
+
+A category limit applies to the spend of the window holding the current
+day: its whole history for "lifetime" limits (read from the running
+`total_spent`), otherwise the current week, month or custom period, which
+resets on the category's `limit_anchor`. The spend of a window is summed
+over a `created_at` range of the (category, created_at, id) index, so it
+only reads the expenses of that window.
+"""
+import calendar
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db.models import Sum
+
+from .models import Expense
+
+MAX_PERIOD_DAYS = 366
+
+
+def month_window_start(day, anchor_day):
+    """Last day on or before `day` that is the anchor day of its month (or that month's last day)"""
+    start = day.replace(day=min(anchor_day, calendar.monthrange(day.year, day.month)[1]))
+    if start > day:
+        previous = day.replace(day=1) - timedelta(days=1)
+        start = previous.replace(
+            day=min(anchor_day, calendar.monthrange(previous.year, previous.month)[1])
+        )
+    return start
+
+
+def limit_window(category, day=None):
+    """(first day, last day) of the category's limit window holding `day`, None for lifetime limits"""
+    day = day or date.today()
+    period = category.limit_period
+    anchor = category.limit_anchor
+    if period == "week":
+        weekday = anchor.weekday() if anchor else 0
+        start = day - timedelta(days=(day.weekday() - weekday) % 7)
+        return start, start + timedelta(days=6)
+    if period == "month":
+        anchor_day = anchor.day if anchor else 1
+        start = month_window_start(day, anchor_day)
+        next_start = month_window_start(start + timedelta(days=31), anchor_day)
+        return start, next_start - timedelta(days=1)
+    if period == "custom":
+        length = category.limit_period_days
+        start = anchor + timedelta(days=(day - anchor).days // length * length)
+        return start, start + timedelta(days=length - 1)
+    return None
+
+
+def window_spent(categories, day=None):
+    """
+    Spend counted against the limit of each category with a limit, keyed by
+    primary key. Categories sharing a window are summed in one query.
+    """
+    spent = {}
+    windows = defaultdict(list)
+    for category in categories:
+        if not category.limit:
+            continue
+        window = limit_window(category, day)
+        if window is None:
+            spent[category.pk] = category.total_spent
+        else:
+            windows[window].append(category.pk)
+            spent[category.pk] = 0
+
+    for (start, end), category_ids in windows.items():
+        rows = (
+            Expense.objects.filter(
+                category_id__in=category_ids, created_at__gte=start, created_at__lte=end
+            )
+            .order_by()
+            .values("category_id")
+            .annotate(total=Sum("amount"))
+        )
+        for row in rows:
+            spent[row["category_id"]] = row["total"]
+    return spent
+
+
+def window_increases(categories, deltas, day=None):
+    """
+    Net change of the spend counted against each category's limit caused by
+    `deltas`, ignoring the expenses that fall outside the current window.
+    """
+    categories = {category.pk: category for category in categories}
+    increases = defaultdict(int)
+    for delta in deltas:
+        category = categories.get(delta.category_id)
+        if category is None or not category.limit:
+            continue
+        window = limit_window(category, day)
+        if window is None or window[0] <= delta.day <= window[1]:
+            increases[category.pk] += delta.amount
+    return increases
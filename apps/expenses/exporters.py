@@ -0,0 +1,92 @@
+"""
+Streaming export of a user's expenses.
+
+Rows are read with a server-side cursor (`QuerySet.iterator`) and written
+out as they arrive, optionally gzip-compressed on the fly, so the response
+starts right away and memory use doesn't depend on the number of rows.
+"""
+import csv
+import json
+import zlib
+
+from .models import Expense
+from .money import format_cents
+
+COLUMNS = ["date", "category", "amount", "description"]
+CHUNK_SIZE = 2000
+
+
+class LineBuffer:
+    """File-like object that hands back what csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(user, window=None):
+    expenses = Expense.objects.filter(owner=user)
+    if window is not None:
+        expenses = window.filter_queryset(expenses)
+    return (
+        expenses.order_by("created_at", "id")
+        .values_list("created_at", "category__name", "amount", "description")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def csv_lines(rows):
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(COLUMNS)
+    for created_at, category, amount, description in rows:
+        yield writer.writerow([created_at.isoformat(), category, format_cents(amount), description])
+
+
+def jsonl_lines(rows):
+    for created_at, category, amount, description in rows:
+        record = {
+            "date": created_at.isoformat(),
+            "category": category,
+            "amount": format_cents(amount),
+            "description": description,
+        }
+        yield json.dumps(record) + "\n"
+
+
+FORMATS = {
+    "csv": (csv_lines, "text/csv"),
+    "jsonl": (jsonl_lines, "application/x-ndjson"),
+}
+
+
+def batched(lines, size=CHUNK_SIZE):
+    """
+    Join lines into larger chunks to keep the number of writes down. The
+    first line goes out on its own so the response starts immediately.
+    """
+    batch = []
+    limit = 1
+    for line in lines:
+        batch.append(line)
+        if len(batch) == limit:
+            yield "".join(batch).encode("utf-8")
+            batch = []
+            limit = size
+    if batch:
+        yield "".join(batch).encode("utf-8")
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        # sync flush so every chunk reaches the client without waiting for the end
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def export_expenses(user, file_type, window=None, gzip=False):
+    """Return the byte chunks of the export and its content type"""
+    to_lines, content_type = FORMATS[file_type]
+    chunks = batched(to_lines(export_rows(user, window)))
+    if gzip:
+        chunks = gzipped(chunks)
+    return chunks, content_type
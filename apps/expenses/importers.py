@@ -0,0 +1,288 @@
+"""
+Streaming import of expense history (bank statements, exports of other apps).
+
+Files are read in fixed-size chunks and parsed by generators, so only the
+current batch of rows is ever held in memory. Each row is validated with
+the same rules as ExpenseSerializer, and valid rows are inserted with
+bulk_create in fixed-size batches, one transaction per batch. Category
+limits are not enforced since the expenses being imported already happened.
+
+Supported formats:
+
+- csv: a header row, columns mapped with `ImportColumns`
+- jsonl: one JSON object per line, keys mapped with `ImportColumns`
+- ofx: the STMTTRN transactions of an OFX (SGML or XML) statement; debits
+  are imported as expenses and credits are skipped
+"""
+import codecs
+import csv
+import json
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from rest_framework.serializers import ValidationError
+
+from .models import Expense
+from .serializers import ExpenseSerializer, get_or_create_categories
+from .signals import send_deltas
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImportColumns:
+    """Names of the source columns (or JSON keys) to read each field from"""
+
+    def __init__(
+        self,
+        date="date",
+        amount="amount",
+        description="description",
+        category="category",
+        date_format="%Y-%m-%d",
+        default_category="Imported",
+    ):
+        self.date = date
+        self.amount = amount
+        self.description = description
+        self.category = category
+        self.date_format = date_format
+        self.default_category = default_category
+
+    def map(self, record):
+        return {
+            "date": record.get(self.date) or None,
+            "amount": record.get(self.amount),
+            "description": record.get(self.description),
+            "category": record.get(self.category) or self.default_category,
+        }
+
+
+class RowError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+
+
+def read_chunks(file, size=CHUNK_SIZE):
+    """Decode a binary file into text chunks of at most `size` bytes"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    while True:
+        data = file.read(size)
+        if not data:
+            break
+        yield decoder.decode(data)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_lines(chunks):
+    buffer = ""
+    for chunk in chunks:
+        # the last piece may be an incomplete line
+        *lines, buffer = (buffer + chunk).split("\n")
+        for line in lines:
+            yield line + "\n"
+    if buffer:
+        yield buffer
+
+
+def parse_csv(chunks, columns):
+    reader = csv.DictReader(iter_lines(chunks))
+    for record in reader:
+        yield reader.line_num, columns.map(record)
+
+
+def parse_jsonl(chunks, columns):
+    for line_num, line in enumerate(iter_lines(chunks), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_num, RowError({"error": "Invalid JSON"})
+            continue
+        if not isinstance(record, dict):
+            yield line_num, RowError({"error": "Expected a JSON object"})
+            continue
+        yield line_num, columns.map(record)
+
+
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def parse_ofx(chunks, columns):
+    """
+    Read the transactions of an OFX statement. SGML OFX doesn't close its
+    value tags, so values are read as the text up to the next tag.
+    """
+    transaction_num = 0
+    current = None
+    for closing, tag, value in iter_ofx_tags(chunks):
+        tag = tag.upper()
+        if tag == "STMTTRN":
+            if not closing:
+                current = {}
+            elif current is not None:
+                transaction_num += 1
+                row = ofx_row(current, columns)
+                if row is not None:
+                    yield transaction_num, row
+                current = None
+        elif current is not None and not closing:
+            current[tag] = value.strip()
+
+
+def iter_ofx_tags(chunks):
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        # the text after the last "<" may continue in the next chunk
+        cut = buffer.rfind("<")
+        if cut <= 0:
+            continue
+        yield from OFX_TAG.findall(buffer[:cut])
+        buffer = buffer[cut:]
+    yield from OFX_TAG.findall(buffer)
+
+
+def ofx_row(record, columns):
+    try:
+        amount = Decimal(record.get("TRNAMT", ""))
+    except InvalidOperation:
+        return RowError({"amount": "A valid number is required."})
+    if not amount.is_finite():
+        return RowError({"amount": "A valid number is required."})
+    if amount >= 0:
+        # credits are income, not expenses
+        return None
+    posted = record.get("DTPOSTED", "")[:8]
+    day = None
+    if posted:
+        # OFX dates are always YYYYMMDD[HHMMSS...], whatever the columns' date_format
+        try:
+            day = datetime.strptime(posted, "%Y%m%d").date()
+        except ValueError:
+            return RowError({"date": "Date must match YYYYMMDD"})
+    return {
+        "date": day,
+        "amount": str(-amount),
+        "description": record.get("MEMO") or record.get("NAME") or "",
+        "category": columns.default_category,
+    }
+
+
+PARSERS = {
+    "csv": parse_csv,
+    "jsonl": parse_jsonl,
+    "ofx": parse_ofx,
+}
+
+
+class ImportReport:
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        # only the first errors are kept so memory stays bounded on bad files
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": row, "errors": errors})
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return round(self.rows / self.elapsed) if self.elapsed else self.rows
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "created": self.created,
+            "failed": self.failed,
+            "seconds": round(self.elapsed, 3),
+            "rows_per_second": self.rows_per_second,
+            "errors": self.errors,
+        }
+
+
+class ExpenseImporter:
+    def __init__(self, user, columns=None, batch_size=1000, max_errors=100):
+        self.user = user
+        self.columns = columns or ImportColumns()
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        # one serializer validates every row, so its fields are only built once
+        self.validator = ExpenseSerializer()
+        self.categories = {}
+
+    def run(self, file, format):
+        report = ImportReport(self.max_errors)
+        rows = PARSERS[format](read_chunks(file), self.columns)
+        batch = []
+        for row_num, row in rows:
+            report.rows += 1
+            try:
+                batch.append(self.build_expense(row))
+            except RowError as error:
+                report.add_error(row_num, error.errors)
+                continue
+            if len(batch) == self.batch_size:
+                report.created += self.insert(batch)
+                batch = []
+        if batch:
+            report.created += self.insert(batch)
+        return report.finish()
+
+    def build_expense(self, row):
+        if isinstance(row, RowError):
+            raise row
+        try:
+            data = self.validator.run_validation(
+                {
+                    "category": {"name": row["category"]},
+                    "amount": row["amount"],
+                    "description": row["description"],
+                }
+            )
+        except ValidationError as error:
+            raise RowError(error.detail)
+
+        expense = Expense(
+            owner=self.user,
+            amount=data["amount"],
+            description=data["description"],
+        )
+        if isinstance(row["date"], date):
+            expense.created_at = row["date"]
+        elif row["date"]:
+            try:
+                expense.created_at = datetime.strptime(row["date"], self.columns.date_format).date()
+            except (TypeError, ValueError):
+                raise RowError({"date": f"Date must match {self.columns.date_format}"})
+        expense.category_name = data["category"]["name"]
+        return expense
+
+    def insert(self, expenses):
+        with transaction.atomic():
+            self.resolve_categories({expense.category_name for expense in expenses})
+            for expense in expenses:
+                expense.category = self.categories[expense.category_name]
+            Expense.objects.bulk_create(expenses)
+            send_deltas([expense.as_delta() for expense in expenses])
+        return len(expenses)
+
+    def resolve_categories(self, names):
+        names = names - set(self.categories)
+        if names:
+            self.categories.update(get_or_create_categories(self.user, names))
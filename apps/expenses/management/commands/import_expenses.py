@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.accounts.models import User
+from apps.expenses.importers import PARSERS, ExpenseImporter, ImportColumns
+
+
+class Command(BaseCommand):
+    help = "Import a CSV, JSON-lines or OFX statement as expenses of a user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--user", required=True, help="Email of the user to import for")
+        parser.add_argument("--format", choices=list(PARSERS))
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--date-column", default="date")
+        parser.add_argument("--amount-column", default="amount")
+        parser.add_argument("--description-column", default="description")
+        parser.add_argument("--category-column", default="category")
+        parser.add_argument("--date-format", default="%Y-%m-%d")
+        parser.add_argument("--default-category", default="Imported")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f'No user with the email "{options["user"]}"')
+
+        format = options["format"] or options["path"].rsplit(".", 1)[-1].lower()
+        if format not in PARSERS:
+            raise CommandError(f"Unknown format, use --format {'/'.join(PARSERS)}")
+
+        columns = ImportColumns(
+            date=options["date_column"],
+            amount=options["amount_column"],
+            description=options["description_column"],
+            category=options["category_column"],
+            date_format=options["date_format"],
+            default_category=options["default_category"],
+        )
+        importer = ExpenseImporter(user, columns, batch_size=options["batch_size"])
+        with open(options["path"], "rb") as file:
+            report = importer.run(file, format)
+
+        for error in report.errors:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report.created} of {report.rows} rows ({report.failed} failed) "
+                f"in {report.elapsed:.1f}s, {report.rows_per_second} rows/s"
+            )
+        )
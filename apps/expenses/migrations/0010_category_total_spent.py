@@ -0,0 +1,40 @@
+# Generated by Django 4.2 on 2026-10-18 19:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_spent(apps, schema_editor):
+    Category = apps.get_model("expenses", "Category")
+    Expense = apps.get_model("expenses", "Expense")
+    totals = (
+        Expense.objects.filter(category=OuterRef("pk"))
+        .order_by()
+        .values("category")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    Category.objects.update(
+        total_spent=Coalesce(
+            Subquery(totals),
+            0,
+            output_field=models.DecimalField(max_digits=20, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0009_alter_expense_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='total_spent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20),
+        ),
+        migrations.RunPython(backfill_total_spent, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models.functions import Upper
+
+"""
+GIN indexes behind apps.expenses.search.PostgresExpenseSearch. They only
+exist on PostgreSQL, so they are created here instead of in Expense.Meta
+and skipped on other databases.
+"""
+SEARCH_INDEXES = [
+    GinIndex(
+        SearchVector("description", config="english"),
+        name="expense_description_fts_idx",
+    ),
+    # serves the UPPER(description) LIKE UPPER('%...%') of icontains
+    GinIndex(
+        OpClass(Upper("description"), name="gin_trgm_ops"),
+        name="expense_description_trgm_idx",
+    ),
+]
+
+
+def add_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Expense = apps.get_model("expenses", "Expense")
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Expense, index)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Expense = apps.get_model("expenses", "Expense")
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Expense, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0011_expense_category_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 19:12
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0012_expense_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='created_at',
+            field=models.DateField(default=datetime.date.today),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2 on 2026-10-18 19:14
+
+import apps.common.models
+from apps.common.models import generate_public_id
+from django.db import migrations, models
+
+
+def backfill_public_ids(apps, schema_editor):
+    for model_name in ["Category", "Expense"]:
+        model = apps.get_model("expenses", model_name)
+        rows = model.objects.filter(public_id__isnull=True).only("pk")
+        batch = []
+        for row in rows.iterator(chunk_size=2000):
+            row.public_id = generate_public_id()
+            batch.append(row)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ["public_id"])
+                batch = []
+        model.objects.bulk_update(batch, ["public_id"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0013_alter_expense_created_at'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='category',
+            name='slug',
+        ),
+        # added as nullable, filled in, then made unique so existing rows
+        # don't all get the same default
+        migrations.AddField(
+            model_name='category',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=11, null=True),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='public_id',
+            field=models.CharField(editable=False, max_length=11, null=True),
+        ),
+        migrations.RunPython(backfill_public_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='category',
+            name='public_id',
+            field=models.CharField(default=apps.common.models.generate_public_id, editable=False, max_length=11, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='public_id',
+            field=models.CharField(default=apps.common.models.generate_public_id, editable=False, max_length=11, unique=True),
+        ),
+    ]
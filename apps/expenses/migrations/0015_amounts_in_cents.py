@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def to_cents(apps, schema_editor):
+    Category = apps.get_model("expenses", "Category")
+    Expense = apps.get_model("expenses", "Expense")
+    Category.objects.update(limit=F("limit") * 100, total_spent=F("total_spent") * 100)
+    Expense.objects.update(amount=F("amount") * 100)
+
+
+def from_cents(apps, schema_editor):
+    Category = apps.get_model("expenses", "Category")
+    Expense = apps.get_model("expenses", "Expense")
+    Category.objects.update(limit=F("limit") / 100, total_spent=F("total_spent") / 100)
+    Expense.objects.update(amount=F("amount") / 100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0014_public_ids'),
+        # the rollup backfill reads decimal amounts, and user_stats 0002 scales it
+        ('user_stats', '0001_initial'),
+    ]
+
+    # values are scaled while the columns are still decimal, then the columns
+    # are converted to integers, which keeps the conversion exact
+    operations = [
+        migrations.RunPython(to_cents, from_cents),
+        migrations.AlterField(
+            model_name='category',
+            name='limit',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='total_spent',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='amount',
+            field=models.BigIntegerField(),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0015_amounts_in_cents'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='limit_anchor',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='limit_period',
+            field=models.CharField(choices=[('lifetime', 'lifetime'), ('week', 'week'), ('month', 'month'), ('custom', 'custom')], default='lifetime', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='limit_period_days',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
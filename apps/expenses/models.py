@@ -1,29 +1,115 @@
-from django.db import models
+from collections import namedtuple
+from datetime import date
 
-from apps.accounts.models import User
-from apps.common.models import BaseModel
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 
-from autoslug import AutoSlugField
+from apps.accounts.models import User
+from apps.common.models import BaseModel, generate_public_id
 
 
+# referenced by migration 0003
 def slugify_name(self):
     return f"{self.name}"
 
+
+class CategoryQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each category with the count and sum of its expenses"""
+        return self.annotate(
+            expense_count=models.Count("expenses"),
+            expense_total=Coalesce(
+                models.Sum("expenses__amount"),
+                models.Value(0),
+                output_field=models.BigIntegerField(),
+            ),
+        )
+
+
+# how long the spend counted against a category limit accumulates before it
+# resets, see apps.expenses.budgets
+LIMIT_PERIODS = ["lifetime", "week", "month", "custom"]
+
+
 class Category(BaseModel):
     name=models.CharField(max_length=30)
-    slug  = AutoSlugField(populate_from=slugify_name, null=True, blank=True, always_update=True, unique=True)
-    limit = models.DecimalField(max_digits=20, decimal_places=2,default="00.00")
+    # stable across renames, used in URLs instead of the primary key
+    public_id = models.CharField(max_length=11, unique=True, default=generate_public_id, editable=False)
+    # money is stored in cents, see apps.expenses.money
+    limit = models.BigIntegerField(default=0)
+    limit_period = models.CharField(
+        max_length=8, choices=[(period, period) for period in LIMIT_PERIODS], default="lifetime"
+    )
+    # a day on which a window starts: weekly windows start on its weekday,
+    # monthly ones on its day of the month, custom ones every
+    # `limit_period_days` days from it
+    limit_anchor = models.DateField(null=True, blank=True)
+    limit_period_days = models.PositiveSmallIntegerField(null=True, blank=True)
     owner = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE)
+    # running sum of the category's expenses, kept in sync by expenses.signals
+    total_spent = models.BigIntegerField(default=0)
+
+    objects = CategoryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "name"], name="category_owner_name_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
 
+# change to the expenses of one (owner, category, day) bucket
+ExpenseDelta = namedtuple(
+    "ExpenseDelta", ["owner_id", "category_id", "day", "amount", "count"]
+)
+
+
 class Expense(BaseModel):
-    category = models.ForeignKey(Category, models.CASCADE, default=1, related_name="expenses")
-    amount = models.DecimalField(max_digits=20, decimal_places=2)
+    # both foreign keys are covered by the composite indexes below
+    category = models.ForeignKey(Category, models.CASCADE, default=1, related_name="expenses", db_index=False)
+    # in cents
+    amount = models.BigIntegerField()
+    public_id = models.CharField(max_length=11, unique=True, default=generate_public_id, editable=False)
     description = models.TextField()
-    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # not auto_now_add so imported expenses can keep their original date
+    created_at = models.DateField(default=date.today)
+
+    class Meta:
+        # matched to the list filters/orderings and the category detail page.
+        # A category belongs to a single owner, so (category, ...) also serves
+        # owner + category queries.
+        indexes = [
+            models.Index(fields=["owner", "created_at", "id"], name="expense_owner_created_idx"),
+            models.Index(fields=["owner", "amount", "id"], name="expense_owner_amount_idx"),
+            models.Index(fields=["category", "created_at", "id"], name="expense_category_created_idx"),
+        ]
 
     def __str__(self):
-        return self.description[:50]
\ No newline at end of file
+        return self.description[:50]
+
+    # the row as it was last read from or written to the database
+    loaded_state = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if {"owner_id", "category_id", "created_at", "amount"} <= set(field_names):
+            instance.loaded_state = instance.as_delta()
+        return instance
+
+    def delete(self, *args, **kwargs):
+        from .signals import expense_deleted
+
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            expense_deleted(self)
+        return deleted
+
+    def as_delta(self):
+        amount = self._meta.get_field("amount").to_python(self.amount)
+        return ExpenseDelta(
+            self.owner_id, self.category_id, self.created_at, amount, 1
+        )
\ No newline at end of file
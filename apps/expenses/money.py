@@ -0,0 +1,39 @@
+"""
+Money is stored as integer cents so totals, rollups and limit checks are
+exact integer math in the database and in Python. Amounts are converted
+to and from the two-decimal format of the API only at the edges, with
+`MoneyField` in serializers and `format_cents` in plain-text outputs.
+"""
+from decimal import Decimal
+
+from rest_framework import serializers
+
+
+def to_cents(value):
+    """Convert a decimal amount (Decimal, str or int) to integer cents"""
+    return int(Decimal(value).scaleb(2).to_integral_value())
+
+
+def from_cents(cents):
+    """Exact Decimal with two places for an amount in cents"""
+    return Decimal(cents).scaleb(-2)
+
+
+def format_cents(cents):
+    return f"{from_cents(cents):.2f}"
+
+
+class MoneyField(serializers.DecimalField):
+    """Decimal in the API, integer cents in validated data and on models"""
+
+    def __init__(self, **kwargs):
+        # 18 digits in cents always fit the signed 64-bit columns
+        kwargs.setdefault("max_digits", 18)
+        kwargs.setdefault("decimal_places", 2)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        return to_cents(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        return super().to_representation(from_cents(value))
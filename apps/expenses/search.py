@@ -0,0 +1,88 @@
+"""
+Search backends for the `query` parameter of the expense list.
+
+Both backends match the query against the expense description and the
+names of the user's categories, and annotate every match with a `rank`
+(higher is better) that the list can be ordered and keyset-paginated by.
+
+- PostgresExpenseSearch uses full-text search (stemmed, websearch syntax)
+  plus substring matching, served by the GIN indexes created in migration
+  0012 (a tsvector expression index and a pg_trgm index on the description).
+- SimpleExpenseSearch is a portable fallback for SQLite (local development
+  and tests) built on case-insensitive substring matching.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.functions import Cast
+
+from .models import Category
+
+
+class SimpleExpenseSearch:
+    def matching_categories(self, owner, query):
+        # resolved up front so the expense query gets a plain `category_id IN (...)`
+        # that can be combined with the description indexes
+        return list(
+            Category.objects.filter(owner=owner, name__icontains=query).values_list(
+                "pk", flat=True
+            )
+        )
+
+    def search(self, queryset, owner, query):
+        categories = self.matching_categories(owner, query)
+        return queryset.filter(
+            Q(description__icontains=query) | Q(category_id__in=categories)
+        ).annotate(
+            rank=Case(
+                When(description__iexact=query, then=Value(1.0)),
+                When(description__istartswith=query, then=Value(0.5)),
+                When(description__icontains=query, then=Value(0.25)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+            + Case(
+                When(category_id__in=categories, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+
+
+class PostgresExpenseSearch(SimpleExpenseSearch):
+    config = "english"
+
+    def search(self, queryset, owner, query):
+        vector = SearchVector("description", config=self.config)
+        search_query = SearchQuery(query, config=self.config, search_type="websearch")
+        categories = self.matching_categories(owner, query)
+        return (
+            queryset.annotate(search=vector)
+            .filter(
+                Q(search=search_query)
+                | Q(description__icontains=query)
+                | Q(category_id__in=categories)
+            )
+            .annotate(
+                # cast the real returned by ts_rank so cursors round-trip exactly
+                rank=Cast(
+                    SearchRank(vector, search_query)
+                    + Case(
+                        When(category_id__in=categories, then=Value(1.0)),
+                        default=Value(0.0),
+                        output_field=FloatField(),
+                    ),
+                    FloatField(),
+                )
+            )
+        )
+
+
+def get_search_backend():
+    if connection.vendor == "postgresql":
+        return PostgresExpenseSearch()
+    return SimpleExpenseSearch()
+
+
+def search_expenses(queryset, owner, query):
+    return get_search_backend().search(queryset, owner, query)
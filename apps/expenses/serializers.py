@@ -1,5 +1,14 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q
+
 from rest_framework import serializers
-from .models import Expense, Category
+from .budgets import MAX_PERIOD_DAYS, limit_window, window_increases, window_spent
+from .models import Expense, Category, ExpenseDelta
+from .money import MoneyField, format_cents, from_cents
+from .search import search_expenses
+from .signals import categories_created, deltas_for_queryset, send_deltas
 from rest_framework.serializers import ValidationError
 from rest_framework.response import Response
 
@@ -7,9 +16,11 @@ from django.urls import reverse
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    id = serializers.CharField(source="public_id", read_only=True)
+
     class Meta:
         model = Category
-        fields = ["name"]
+        fields = ["id", "name"]
 
     def __init__(self, instance=None, data=None, user=None, **kwargs):
         self.user = user 
@@ -25,11 +36,13 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class ExpenseSerializer(serializers.ModelSerializer):
+    id = serializers.CharField(source="public_id", read_only=True)
     category = CategorySerializer()
+    amount = MoneyField()
 
     class Meta:
         model = Expense
-        fields = ["category", "amount", "description", "owner", "created_at"]
+        fields = ["id", "category", "amount", "description", "owner", "created_at"]
 
         read_only_fields = ["owner", "created_at"]
 
@@ -41,18 +54,164 @@ class ExpenseSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         category_data = validated_data.pop("category")
-        category, created = Category.objects.get_or_create(name=category_data["name"], owner=self.context["user"])
+        with transaction.atomic():
+            category, created = Category.objects.get_or_create(name=category_data["name"], owner=self.context["user"])
+            # lock the category so concurrent expenses are checked one at a time
+            category = Category.objects.select_for_update().get(pk=category.pk)
+
+            spent = window_spent([category])
+            if category.limit and spent[category.pk] + validated_data["amount"] > category.limit:
+                raise ValidationError({"error": "Limit has been reached"})
+
+            return Expense.objects.create(category=category, **validated_data)
+
+    def update(self, instance, validated_data):
+        category_data = validated_data.pop("category", None)
+        with transaction.atomic():
+            if category_data is not None:
+                category, created = Category.objects.get_or_create(
+                    name=category_data["name"], owner=instance.owner
+                )
+            else:
+                category = instance.category
+            # lock the current and the new category in primary key order
+            # before the expense row, the same order as bulk writes
+            locked = {
+                row.pk: row
+                for row in Category.objects.select_for_update()
+                .filter(pk__in={category.pk, instance.category_id})
+                .order_by("pk")
+            }
+            category = locked[category.pk]
+
+            amount = validated_data.get("amount", instance.amount)
+            # the expense's current amount may already count against the limit
+            increase = window_increases(
+                [category],
+                [
+                    ExpenseDelta(instance.owner_id, instance.category_id, instance.created_at, -instance.amount, -1),
+                    ExpenseDelta(instance.owner_id, category.pk, instance.created_at, amount, 1),
+                ],
+            )[category.pk]
+            if increase > 0 and category.limit:
+                if window_spent([category])[category.pk] + increase > category.limit:
+                    raise ValidationError({"error": "Limit has been reached"})
+
+            instance.category = category
+            for field, value in validated_data.items():
+                setattr(instance, field, value)
+            instance.save()
+            return instance
+
+
+def get_or_create_categories(user, names):
+    """
+    Map each name to the user's category, creating the missing ones with one
+    bulk insert. The categories are locked so limits are checked one request
+    at a time.
+    """
+    categories = {}
+    for category in (
+        Category.objects.select_for_update()
+        .filter(owner=user, name__in=names)
+        .order_by("pk")
+    ):
+        categories.setdefault(category.name, category)
+
+    missing = [
+        Category(name=name, owner=user)
+        for name in names
+        if name not in categories
+    ]
+    for category in Category.objects.bulk_create(missing):
+        categories[category.name] = category
+    if missing:
+        categories_created.send(sender=Category, owner_id=user.pk)
+    return categories
+
+
+class BulkExpenseSerializer(serializers.Serializer):
+    """
+    Creates many expenses in one request, e.g. when a client syncs expenses
+    entered offline. Each item is validated like a single ExpenseSerializer
+    payload and gets its own result, so one bad item doesn't reject the batch.
+
+    The categories of the whole batch are resolved with one query, missing
+    ones are created with one bulk insert, each category's limit is checked
+    once against its stored total, and the expenses are bulk inserted.
+    Expects the user in context["user"].
+    """
+
+    max_items = 500
+
+    expenses = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=max_items
+    )
+
+    def create(self, validated_data):
+        user = self.context["user"]
+        results = [None] * len(validated_data["expenses"])
+        items = []
+        for index, data in enumerate(validated_data["expenses"]):
+            item = ExpenseSerializer(data=data)
+            if item.is_valid():
+                items.append((index, item.validated_data))
+            else:
+                results[index] = {"index": index, "status": "error", "errors": item.errors}
+
+        with transaction.atomic():
+            categories = get_or_create_categories(user, {data["category"]["name"] for _, data in items})
+            spent = window_spent(categories.values())
+
+            expenses = []
+            for index, data in items:
+                category = categories[data["category"]["name"]]
+                amount = data["amount"]
+                if category.limit and spent[category.pk] + amount > category.limit:
+                    results[index] = {
+                        "index": index,
+                        "status": "error",
+                        "errors": {"error": "Limit has been reached"},
+                    }
+                    continue
+                if category.limit:
+                    spent[category.pk] += amount
+                expense = Expense(
+                    category=category,
+                    owner=user,
+                    amount=amount,
+                    description=data["description"],
+                )
+                expenses.append((index, expense))
+
+            Expense.objects.bulk_create([expense for _, expense in expenses])
+            send_deltas([expense.as_delta() for _, expense in expenses])
 
-        if float(category.limit) != 00.00:
-            limit = float(category.limit)
-            total = 0
-            for expense in category.expenses.all():
-                total += expense.amount
-            difference = limit - float(total)
-            if difference <= 0:
-                raise ValidationError({"error":"Limit hss been reached"})
+        for index, expense in expenses:
+            results[index] = {
+                "index": index,
+                "status": "created",
+                "data": ExpenseListSerializer(expense).data,
+            }
+        return results
 
-        return Expense.objects.create(category=category, **validated_data)
+class ExpenseListSerializer(serializers.BaseSerializer):
+    """
+    Read-only serializer for expense list responses. It produces the same
+    output as ExpenseSerializer but reads the attributes directly instead of
+    going through a field object per column, and expects the category to be
+    loaded with select_related("category").
+    """
+
+    def to_representation(self, instance):
+        return {
+            "id": instance.public_id,
+            "category": {"id": instance.category.public_id, "name": instance.category.name},
+            "amount": format_cents(instance.amount),
+            "description": instance.description,
+            "owner": instance.owner_id,
+            "created_at": instance.created_at.isoformat(),
+        }
 
 
 class ExpenseInfoSerializer(serializers.ModelSerializer):
@@ -62,48 +221,341 @@ class ExpenseInfoSerializer(serializers.ModelSerializer):
     only need the amount and description
     """
 
+    id = serializers.CharField(source="public_id", read_only=True)
+    amount = MoneyField(read_only=True)
+
     class Meta:
         model = Expense
-        fields = ["amount", "description", "created_at"]
+        fields = ["id", "amount", "description", "created_at"]
 
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
+    id = serializers.CharField(source="public_id", read_only=True)
+    limit = MoneyField(read_only=True)
     count = serializers.SerializerMethodField(read_only=True)
-    expenses = ExpenseInfoSerializer(many=True)
+    # the view sets `expense_page` to the requested page of the category's expenses
+    expenses = ExpenseInfoSerializer(source="expense_page", many=True, read_only=True)
     total = serializers.SerializerMethodField(read_only=True)
     difference_from_limit = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Category
         fields = [
+            "id",
             "name", 
             "limit", 
+            "limit_period",
             "count", 
             "total", 
             "difference_from_limit",  
             "expenses"
         ]
 
+    # count and total come from Category.objects.with_totals()
     def get_count(self, obj) -> int:
-        return obj.expenses.count()
+        return obj.expense_count
 
-    def get_total(self, obj) -> int:
-        sum = 0
-        for expense in obj.expenses.all():
-            sum += expense.amount
-        return sum
+    def get_total(self, obj) -> Decimal:
+        return from_cents(obj.expense_total)
 
     def get_difference_from_limit(self,obj) -> float:
         limit = obj.limit
         if not limit:
             return 0
-        total = self.get_total(obj)
 
-        difference = limit - total
-        return float(difference)
+        if obj.limit_period == "lifetime":
+            difference = limit - obj.expense_total
+        else:
+            # periodic limits only count the spend of the current window
+            difference = limit - window_spent([obj])[obj.pk]
+        return float(from_cents(difference))
 
 
 class CategoryLimitSerializer(serializers.ModelSerializer):
+    """
+    Sets the limit of a category and the period it applies to. Weekly and
+    monthly windows start on Monday and on the 1st unless `limit_anchor`
+    is given; custom windows need both an anchor and a length in days.
+    """
+
+    limit = MoneyField()
+    limit_period_days = serializers.IntegerField(
+        min_value=1, max_value=MAX_PERIOD_DAYS, required=False, allow_null=True
+    )
+    window = serializers.SerializerMethodField(read_only=True)
+
     class Meta:
         model = Category
-        fields = ["limit"]
+        fields = ["limit", "limit_period", "limit_anchor", "limit_period_days", "window"]
+
+    def validate(self, attrs):
+        def current(field):
+            return attrs.get(field, getattr(self.instance, field, None))
+
+        period = current("limit_period")
+        if period == "custom":
+            if not current("limit_anchor") or not current("limit_period_days"):
+                raise ValidationError(
+                    {"limit_period": "Custom periods need a limit_anchor and limit_period_days"}
+                )
+        elif "limit_period" in attrs:
+            attrs["limit_period_days"] = None
+        return attrs
+
+    def get_window(self, obj) -> dict:
+        window = limit_window(obj)
+        if window is None:
+            return None
+        return {"start": window[0], "end": window[1]}
+
+
+class DateWindowSerializer(serializers.Serializer):
+    """
+    Validates the optional `start_date`/`end_date` query parameters used to
+    restrict a list of expenses to a date window
+    """
+
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        start_date = attrs.get("start_date")
+        end_date = attrs.get("end_date")
+        if start_date and end_date and start_date > end_date:
+            raise ValidationError({"end_date": "end_date must not be before start_date"})
+        return attrs
+
+    def filter_queryset(self, queryset, field="created_at"):
+        if "start_date" in self.validated_data:
+            queryset = queryset.filter(**{f"{field}__gte": self.validated_data["start_date"]})
+        if "end_date" in self.validated_data:
+            queryset = queryset.filter(**{f"{field}__lte": self.validated_data["end_date"]})
+        return queryset
+
+
+class ExpenseFilterSerializer(DateWindowSerializer):
+    """
+    Validates the filters of the expense list. Every filter is applied on top
+    of the owner filter so the query stays on one of the (owner, ...) indexes
+    declared on Expense. Expects the user in context["user"].
+    """
+
+    # ordering value -> (field, tie breaker) used by the keyset pagination
+    ORDERINGS = {
+        "-created_at": ("-created_at", "-id"),
+        "created_at": ("created_at", "id"),
+        "-amount": ("-amount", "-id"),
+        "amount": ("amount", "id"),
+        "relevance": ("-rank", "-id"),
+    }
+
+    query = serializers.CharField(required=False, allow_blank=True, max_length=100)
+    min_amount = MoneyField(required=False)
+    max_amount = MoneyField(required=False)
+    category = serializers.CharField(max_length=11, required=False)
+    ordering = serializers.ChoiceField(choices=list(ORDERINGS), required=False)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if attrs.get("ordering") == "relevance" and not attrs.get("query"):
+            raise ValidationError({"ordering": "relevance ordering needs a search query"})
+        min_amount = attrs.get("min_amount")
+        max_amount = attrs.get("max_amount")
+        if min_amount is not None and max_amount is not None and min_amount > max_amount:
+            raise ValidationError({"max_amount": "max_amount must not be below min_amount"})
+        return attrs
+
+    def get_ordering(self):
+        # search results are ranked unless another ordering is asked for
+        default = "relevance" if self.validated_data.get("query") else "-created_at"
+        return self.ORDERINGS[self.validated_data.get("ordering", default)]
+
+    def filter_queryset(self, queryset, field="created_at"):
+        queryset = super().filter_queryset(queryset, field)
+        if self.validated_data.get("query"):
+            queryset = search_expenses(
+                queryset, self.context["user"], self.validated_data["query"]
+            )
+        if "min_amount" in self.validated_data:
+            queryset = queryset.filter(amount__gte=self.validated_data["min_amount"])
+        if "max_amount" in self.validated_data:
+            queryset = queryset.filter(amount__lte=self.validated_data["max_amount"])
+        if "category" in self.validated_data:
+            # resolve the id first so the expense query filters on (owner, category)
+            category_id = (
+                Category.objects.filter(
+                    public_id=self.validated_data["category"], owner=self.context["user"]
+                )
+                .values_list("pk", flat=True)
+                .first()
+            )
+            queryset = queryset.filter(category_id=category_id)
+        return queryset
+
+
+class ExpenseImportSerializer(serializers.Serializer):
+    """
+    Upload of a statement to import. The column fields name the source columns
+    (or JSON keys) to read each expense field from.
+    """
+
+    FORMATS = ["csv", "jsonl", "ofx"]
+
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=FORMATS, required=False)
+    date_column = serializers.CharField(default="date")
+    amount_column = serializers.CharField(default="amount")
+    description_column = serializers.CharField(default="description")
+    category_column = serializers.CharField(default="category")
+    date_format = serializers.CharField(default="%Y-%m-%d")
+    default_category = serializers.CharField(max_length=30, default="Imported")
+
+    def validate(self, attrs):
+        if "format" not in attrs:
+            # fall back to the file extension
+            extension = attrs["file"].name.rsplit(".", 1)[-1].lower()
+            if extension not in self.FORMATS:
+                raise ValidationError({"format": f"Pick one of {', '.join(self.FORMATS)}"})
+            attrs["format"] = extension
+        return attrs
+
+
+class ExpenseExportSerializer(DateWindowSerializer):
+    file_type = serializers.ChoiceField(choices=["csv", "jsonl"], default="csv")
+    gzip = serializers.BooleanField(default=False)
+
+
+class ExpenseSelectionSerializer(serializers.Serializer):
+    """
+    Selects the expenses a bulk operation applies to, either by id or with the
+    filters of the expense list, up to `max_items` expenses. Expects the user
+    in context["user"].
+    """
+
+    max_items = 1000
+
+    ids = serializers.ListField(
+        child=serializers.CharField(max_length=11), required=False, allow_empty=False, max_length=max_items
+    )
+    filter = serializers.DictField(required=False)
+
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise ValidationError({"error": "Provide either ids or filter"})
+        if "filter" in attrs:
+            filters = ExpenseFilterSerializer(data=attrs["filter"], context=self.context)
+            filters.is_valid(raise_exception=True)
+            attrs["filter"] = filters
+        return attrs
+
+    def get_queryset(self):
+        user = self.context["user"]
+        if "ids" in self.validated_data:
+            return Expense.objects.filter(owner=user, public_id__in=self.validated_data["ids"])
+        selected = self.validated_data["filter"].filter_queryset(Expense.objects.filter(owner=user))
+        # filter on the ids of the match so updates and deletes run on a plain queryset
+        return Expense.objects.filter(owner=user, pk__in=selected.values("pk"))
+
+    def lock_categories(self, names=()):
+        """
+        Lock the categories of the selected expenses, and the user's
+        categories named in `names`, in primary key order. Runs before
+        lock_selection: single expense writes lock their categories before the
+        expense row, so bulk writes take the locks in the same order. Must run
+        inside a transaction.
+        """
+        selected = Q(pk__in=self.get_queryset().values("category_id"))
+        named = Q(owner=self.context["user"], name__in=names)
+        return list(Category.objects.select_for_update().filter(selected | named).order_by("pk"))
+
+    def lock_selection(self):
+        """
+        Lock the selected rows and return a queryset of exactly those rows. The
+        deltas and the write then cover the locked rows only, so rows
+        committed or edited concurrently can't be changed without being
+        counted. Must run inside a transaction.
+        """
+        pks = list(
+            self.get_queryset()
+            .select_for_update()
+            .order_by("pk")
+            .values_list("pk", flat=True)[: self.max_items + 1]
+        )
+        if len(pks) > self.max_items:
+            raise ValidationError({"error": f"Select at most {self.max_items} expenses"})
+        return Expense.objects.filter(pk__in=pks)
+
+
+class BulkExpenseUpdateSerializer(ExpenseSelectionSerializer):
+    """
+    Moves the selected expenses to another category (created if missing)
+    and/or sets their amount. The locked selection is counted with one
+    grouped query and written with one UPDATE statement.
+    """
+
+    category = serializers.CharField(max_length=30, required=False)
+    amount = MoneyField(required=False)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        if "category" not in attrs and "amount" not in attrs:
+            raise ValidationError({"error": "Provide a category and/or an amount to set"})
+        if "amount" in attrs and attrs["amount"] <= 0:
+            raise ValidationError({"amount": "Amount must be greater than 0"})
+        return attrs
+
+    def save(self):
+        user = self.context["user"]
+        name = self.validated_data.get("category")
+        changes = {}
+        with transaction.atomic():
+            self.lock_categories([name] if name else [])
+            selection = self.lock_selection()
+            if name:
+                changes["category"] = get_or_create_categories(user, {name})[name]
+            if "amount" in self.validated_data:
+                changes["amount"] = self.validated_data["amount"]
+
+            removed = deltas_for_queryset(selection, sign=-1)
+            added = [
+                delta._replace(
+                    category_id=changes["category"].pk if "category" in changes else delta.category_id,
+                    amount=changes["amount"] * -delta.count if "amount" in changes else -delta.amount,
+                    count=-delta.count,
+                )
+                for delta in removed
+            ]
+            self.check_limits(removed + added)
+
+            updated = selection.update(**changes)
+            send_deltas(removed + added)
+        return updated
+
+    def check_limits(self, deltas):
+        categories = Category.objects.select_for_update().filter(
+            pk__in={delta.category_id for delta in deltas}, limit__gt=0
+        )
+        increases = window_increases(categories, deltas)
+        categories = [category for category in categories if increases[category.pk] > 0]
+        spent = window_spent(categories)
+        for category in categories:
+            if spent[category.pk] + increases[category.pk] > category.limit:
+                raise ValidationError({"error": f'Limit of category "{category.name}" would be exceeded'})
+
+
+class BulkExpenseDeleteSerializer(ExpenseSelectionSerializer):
+    """
+    Deletes the selected expenses. The locked selection is counted with one
+    grouped query and deleted with one DELETE statement.
+    """
+
+    def save(self):
+        with transaction.atomic():
+            self.lock_categories()
+            selection = self.lock_selection()
+            removed = deltas_for_queryset(selection, sign=-1)
+            # nothing references expenses and no signal listens to their
+            # deletion, so the ORM deletes them without loading them
+            deleted, _ = selection.delete()
+            send_deltas(removed)
+        return deleted
@@ -0,0 +1,122 @@
+"""
+Every change to the expense table is described as a list of deltas, one
+per (owner, category, day) bucket. Anything that keeps derived totals
+(rollups, counters) listens to `expenses_changed` instead of hooking the
+Expense model directly, so single saves and set-based bulk operations go
+through the same code path. Like bulk_create() and update(), queryset
+deletes don't send deltas: their callers send them.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, QuerySet, Sum
+from django.db.models.signals import post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from apps.accounts.models import User
+from .models import Category, Expense, ExpenseDelta
+
+# sent with `deltas`, a list of ExpenseDelta merged per bucket
+expenses_changed = Signal()
+# sent with `owner_id` when categories are created in bulk, which doesn't
+# send post_save
+categories_created = Signal()
+
+
+def merge_deltas(deltas):
+    buckets = defaultdict(lambda: [0, 0])
+    for delta in deltas:
+        key = (delta.owner_id, delta.category_id, delta.day)
+        buckets[key][0] += delta.amount
+        buckets[key][1] += delta.count
+    return [
+        ExpenseDelta(owner_id, category_id, day, amount, count)
+        for (owner_id, category_id, day), (amount, count) in buckets.items()
+        if amount or count
+    ]
+
+
+def send_deltas(deltas):
+    deltas = merge_deltas(deltas)
+    if deltas:
+        expenses_changed.send(sender=Expense, deltas=deltas)
+
+
+def deltas_for_queryset(queryset, sign=1):
+    """
+    Group the rows of an expense queryset per bucket in one query, for
+    operations that add or remove many expenses at once.
+    """
+    rows = (
+        queryset.order_by()
+        .values("owner_id", "category_id", "created_at")
+        .annotate(amount=Sum("amount"), count=Count("id"))
+    )
+    return [
+        ExpenseDelta(
+            row["owner_id"],
+            row["category_id"],
+            row["created_at"],
+            sign * row["amount"],
+            sign * row["count"],
+        )
+        for row in rows
+    ]
+
+
+@receiver(pre_save, sender=Expense)
+def expense_saving(sender, instance, raw=False, **kwargs):
+    # instances built by hand or loaded with deferred fields don't know the
+    # stored row they are about to overwrite
+    if raw or instance.pk is None or instance.loaded_state is not None:
+        return
+    stored = (
+        Expense.objects.filter(pk=instance.pk)
+        .values_list("owner_id", "category_id", "created_at", "amount")
+        .first()
+    )
+    if stored is not None:
+        instance.loaded_state = ExpenseDelta(*stored, 1)
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, created, **kwargs):
+    deltas = []
+    previous = instance.loaded_state
+    if previous is not None and not created:
+        deltas.append(previous._replace(amount=-previous.amount, count=-1))
+    deltas.append(instance.as_delta())
+    instance.loaded_state = instance.as_delta()
+    send_deltas(deltas)
+
+
+def expense_deleted(instance):
+    """
+    Called by Expense.delete(). Not a post_delete receiver: with one, the ORM
+    could no longer delete expenses with a single statement, and deleting a
+    user or a category would run the receiver once per expense.
+    """
+    previous = instance.loaded_state or instance.as_delta()
+    send_deltas([previous._replace(amount=-previous.amount, count=-1)])
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, origin=None, **kwargs):
+    # the category's expenses are deleted with it in one statement, so their
+    # removal is counted here in one query. A deleted owner takes every
+    # derived total with it.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is User:
+        return
+    send_deltas(deltas_for_queryset(instance.expenses.all(), sign=-1))
+
+
+@receiver(expenses_changed)
+def update_category_totals(sender, deltas, **kwargs):
+    totals = defaultdict(int)
+    for delta in deltas:
+        totals[delta.category_id] += delta.amount
+    for category_id, amount in totals.items():
+        if amount:
+            Category.objects.filter(pk=category_id).update(
+                total_spent=F("total_spent") + amount
+            )
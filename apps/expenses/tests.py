@@ -1,3 +1,1015 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+from rest_framework.utils.encoders import JSONEncoder
+
+from apps.accounts.models import User
+from apps.expenses.budgets import limit_window
+from apps.expenses.models import Category, Expense
+from apps.expenses.importers import ImportColumns, parse_csv
+from apps.expenses.search import search_expenses
+from apps.expenses.serializers import (
+    ExpenseFilterSerializer,
+    ExpenseSelectionSerializer,
+    ExpenseSerializer,
+)
+from apps.user_stats.models import DailySpend
+
+
+def create_user(email="expenses@mail.com"):
+    return User.objects.create_user(
+        first_name="test", last_name="user", email=email, password="testuser"
+    )
+
+
+class CategoryLimitTests(TestCase):
+    url = "/api/v1/expenses/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user, limit=2000)
+
+    def post_expense(self, amount, category="Food"):
+        return self.client.post(
+            self.url,
+            {"category": {"name": category}, "amount": amount, "description": "lunch"},
+            format="json",
+        )
+
+    def test_total_spent_follows_expense_writes(self):
+        self.post_expense("5.00")
+        self.post_expense("7.50")
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 1250)
+
+        expense = Expense.objects.get(amount=750)
+        expense.amount = 150
+        expense.save()
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 650)
+
+        expense.delete()
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 500)
+
+    def test_expense_over_the_limit_is_rejected(self):
+        self.assertEqual(self.post_expense("15.00").status_code, 201)
+        self.assertEqual(self.post_expense("5.00").status_code, 201)
+
+        response = self.post_expense("0.01")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Expense.objects.count(), 2)
+
+    def test_category_without_limit_is_not_capped(self):
+        self.assertEqual(self.post_expense("1000.00", category="Rent").status_code, 201)
+
+    def test_setting_a_limit_requires_authentication(self):
+        response = APIClient().patch(
+            f"/api/v1/categories/{self.food.public_id}/set-limit/", {"limit": "1.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_amounts_must_fit_in_cents_columns(self):
+        Category.objects.filter(pk=self.food.pk).update(limit=0)
+        self.assertEqual(self.post_expense("99999999999999999.99").status_code, 400)
+        self.assertEqual(self.post_expense("9999999999999999.99").status_code, 201)
+
+    def test_amounts_are_stored_in_cents(self):
+        self.client.patch(
+            f"/api/v1/categories/{self.food.public_id}/set-limit/", {"limit": "0.30"}, format="json"
+        )
+        # 0.1 + 0.2 > 0.3 in floating point, but not in cents
+        self.assertEqual(self.post_expense("0.10").status_code, 201)
+        self.assertEqual(self.post_expense("0.20").status_code, 201)
+        self.assertEqual(self.post_expense("0.01").status_code, 400)
+
+        self.food.refresh_from_db()
+        self.assertEqual((self.food.limit, self.food.total_spent), (30, 30))
+        response = self.client.get(f"/api/v1/categories/{self.food.public_id}/")
+        self.assertEqual(response.data["data"]["limit"], "0.30")
+        self.assertEqual(self.post_expense("0.015").status_code, 400)
+
+
+class PeriodicLimitTests(TestCase):
+    url = "/api/v1/expenses/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(
+            name="Food", owner=self.user, limit=2000, limit_period="month"
+        )
+        # spent in an earlier window
+        Expense.objects.create(
+            category=self.food,
+            amount=1500,
+            description="old",
+            owner=self.user,
+            created_at=date.today() - timedelta(days=40),
+        )
+
+    def post_expense(self, amount):
+        return self.client.post(
+            self.url,
+            {"category": {"name": "Food"}, "amount": amount, "description": "lunch"},
+            format="json",
+        )
+
+    def window(self, period, day, anchor=None, days=None):
+        category = Category(limit_period=period, limit_anchor=anchor, limit_period_days=days)
+        return limit_window(category, day)
+
+    def test_windows(self):
+        self.assertIsNone(self.window("lifetime", date(2024, 3, 15)))
+        self.assertEqual(
+            self.window("week", date(2024, 3, 15)), (date(2024, 3, 11), date(2024, 3, 17))
+        )
+        # weeks starting on the anchor's weekday (a Friday)
+        self.assertEqual(
+            self.window("week", date(2024, 3, 14), anchor=date(2024, 1, 5)),
+            (date(2024, 3, 8), date(2024, 3, 14)),
+        )
+        self.assertEqual(
+            self.window("month", date(2024, 2, 10)), (date(2024, 2, 1), date(2024, 2, 29))
+        )
+        # pay day on the 31st falls back to the last day of shorter months
+        self.assertEqual(
+            self.window("month", date(2024, 3, 10), anchor=date(2024, 1, 31)),
+            (date(2024, 2, 29), date(2024, 3, 30)),
+        )
+        self.assertEqual(
+            self.window("month", date(2024, 3, 31), anchor=date(2024, 1, 31)),
+            (date(2024, 3, 31), date(2024, 4, 29)),
+        )
+        self.assertEqual(
+            self.window("custom", date(2024, 1, 20), anchor=date(2024, 1, 1), days=14),
+            (date(2024, 1, 15), date(2024, 1, 28)),
+        )
+        self.assertEqual(
+            self.window("custom", date(2023, 12, 31), anchor=date(2024, 1, 1), days=14),
+            (date(2023, 12, 18), date(2023, 12, 31)),
+        )
+
+    def test_only_the_current_window_counts(self):
+        self.assertEqual(self.post_expense("15.00").status_code, 201)
+        self.assertEqual(self.post_expense("5.00").status_code, 201)
+        self.assertEqual(self.post_expense("0.01").status_code, 400)
+
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 3500)
+
+    def test_window_total_reads_an_index_range(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_expense("1.00")
+        window_query = next(query["sql"] for query in queries if "SUM" in query["sql"])
+        self.assertIn('"created_at" >=', window_query)
+        self.assertIn('"created_at" <=', window_query)
+
+    def test_moving_old_expenses_into_the_category_is_not_capped(self):
+        rent = Category.objects.create(name="Rent", owner=self.user)
+        Expense.objects.create(
+            category=rent,
+            amount=5000,
+            description="old",
+            owner=self.user,
+            created_at=date.today() - timedelta(days=62),
+        )
+        response = self.client.patch(
+            "/api/v1/expenses/bulk/selection/",
+            {"filter": {"category": rent.public_id}, "category": "Food"},
+            format="json",
+        )
+        self.assertEqual(response.data, {"updated": 1})
+
+    def test_setting_a_period(self):
+        url = f"/api/v1/categories/{self.food.public_id}/set-limit/"
+        response = self.client.patch(
+            url,
+            {"limit": "50.00", "limit_period": "custom", "limit_anchor": "2024-01-01"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.patch(
+            url,
+            {
+                "limit": "50.00",
+                "limit_period": "custom",
+                "limit_anchor": "2024-01-01",
+                "limit_period_days": 10,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        window = response.data["data"]["window"]
+        self.assertEqual((window["end"] - window["start"]).days, 9)
+
+        response = self.client.patch(url, {"limit": "50.00", "limit_period": "week"}, format="json")
+        self.food.refresh_from_db()
+        self.assertEqual((self.food.limit_period, self.food.limit_period_days), ("week", None))
+
+        detail = self.client.get(f"/api/v1/categories/{self.food.public_id}/").data["data"]
+        self.assertEqual(detail["limit_period"], "week")
+        self.assertEqual(detail["difference_from_limit"], 50.0)
+
+
+class ConcurrentCategoryLimitTests(TransactionTestCase):
+    url = "/api/v1/expenses/"
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_parallel_inserts_cannot_exceed_the_limit(self):
+        user = create_user()
+        category = Category.objects.create(name="Food", owner=user, limit=5000)
+        barrier = threading.Barrier(10)
+        statuses = []
+
+        def post_expense():
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                response = client.post(
+                    self.url,
+                    {"category": {"name": "Food"}, "amount": "10.00", "description": "x"},
+                    format="json",
+                )
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=post_expense) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        category.refresh_from_db()
+        self.assertEqual(sorted(statuses), [201] * 5 + [400] * 5)
+        self.assertEqual(category.total_spent, 5000)
+        self.assertEqual(Expense.objects.filter(category=category).count(), 5)
+
+
+class CategoryDetailTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user, limit=10000)
+        for amount in [1000, 2050, 450]:
+            Expense.objects.create(
+                category=self.food, amount=amount, description="lunch", owner=self.user
+            )
+
+    def test_aggregates_come_from_the_category_query(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/v1/categories/{self.food.public_id}/")
+
+        data = response.data["data"]
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(data["total"], Decimal("35.00"))
+        self.assertEqual(data["difference_from_limit"], 65.0)
+        self.assertEqual(len(data["expenses"]), 3)
+
+    def test_expenses_are_paginated_newest_first(self):
+        url = f"/api/v1/categories/{self.food.public_id}/"
+        response = self.client.get(url, {"page_size": 2})
+        data = response.data["data"]
+
+        self.assertEqual([e["amount"] for e in data["expenses"]], ["4.50", "20.50"])
+        self.assertEqual(data["count"], 3)
+
+        data = self.client.get(data["next"]).data["data"]
+        self.assertEqual([e["amount"] for e in data["expenses"]], ["10.00"])
+        self.assertIsNone(data["next"])
+        self.assertEqual(data["total"], Decimal("35.00"))
+
+    def test_expenses_can_be_windowed_by_date(self):
+        url = f"/api/v1/categories/{self.food.public_id}/"
+        response = self.client.get(url, {"end_date": "2000-01-01"})
+        data = response.data["data"]
+
+        self.assertEqual(data["expenses"], [])
+        self.assertEqual(data["count"], 3)
+
+        response = self.client.get(url, {"start_date": "2000-01-02", "end_date": "2000-01-01"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExpenseDetailTests(TestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user, limit=5000)
+        self.expense = Expense.objects.create(
+            category=self.food, amount=2000, description="lunch", owner=self.user
+        )
+        self.url = f"/api/v1/expenses/{self.expense.public_id}/"
+
+    def test_public_ids_are_short_and_stable(self):
+        self.assertEqual(len(self.expense.public_id), 11)
+        self.assertNotEqual(self.food.public_id, self.expense.public_id)
+        public_id = self.food.public_id
+        self.food.name = "Groceries"
+        with self.assertNumQueries(1):
+            self.food.save()
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.public_id, public_id)
+
+    def test_detail_is_one_lookup(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.data["id"], self.expense.public_id)
+        self.assertEqual(response.data["category"], {"id": self.food.public_id, "name": "Food"})
+
+    def test_update_moves_totals(self):
+        payload = {"category": {"name": "Travel"}, "amount": "35.00", "description": "taxi"}
+        response = self.client.put(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        travel = Category.objects.get(owner=self.user, name="Travel")
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 0)
+        self.assertEqual(travel.total_spent, 3500)
+
+    def test_update_checks_limit_against_the_change(self):
+        payload = {"category": {"name": "Food"}, "amount": "50.00", "description": "dinner"}
+        self.assertEqual(self.client.put(self.url, payload, format="json").status_code, 200)
+
+        payload["amount"] = "50.01"
+        self.assertEqual(self.client.put(self.url, payload, format="json").status_code, 400)
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 5000)
+
+    def test_delete(self):
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(Expense.objects.filter(pk=self.expense.pk).exists())
+
+    def test_other_users_expenses_are_not_found(self):
+        other = APIClient()
+        other.force_authenticate(create_user(email="other@mail.com"))
+
+        self.assertEqual(other.get(self.url).status_code, 404)
+        self.assertEqual(other.delete(self.url).status_code, 404)
+        response = other.get(f"/api/v1/categories/{self.food.public_id}/")
+        self.assertEqual(response.status_code, 404)
+
+class ExpenseListPaginationTests(TestCase):
+    url = "/api/v1/expenses/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        food = Category.objects.create(name="Food", owner=self.user)
+        self.expenses = [
+            Expense.objects.create(
+                category=food, amount=i + 1, description=f"expense {i}", owner=self.user
+            )
+            for i in range(25)
+        ]
+
+    def descriptions(self, response):
+        return [expense["description"] for expense in response.data["results"]]
+
+    def test_cursor_walks_every_expense_newest_first(self):
+        seen = []
+        response = self.client.get(self.url, {"page_size": 10})
+        while True:
+            seen += self.descriptions(response)
+            if not response.data["next"]:
+                break
+            response = self.client.get(response.data["next"])
+
+        self.assertEqual(seen, [f"expense {i}" for i in reversed(range(25))])
+        self.assertNotIn("count", response.data)
+
+    def test_previous_cursor_returns_the_same_page(self):
+        first = self.client.get(self.url)
+        second = self.client.get(first.data["next"])
+        back = self.client.get(second.data["previous"])
+
+        self.assertEqual(self.descriptions(back), self.descriptions(first))
+        self.assertIsNone(back.data["previous"])
+
+    def test_page_size_is_capped_and_count_is_optional(self):
+        response = self.client.get(self.url, {"page_size": 1000, "count": "true"})
+
+        self.assertEqual(len(response.data["results"]), 25)
+        self.assertEqual(response.data["count"], 25)
+
+    def test_later_pages_do_not_count_or_offset(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(first.data["next"])
+
+        sql = " ".join(query["sql"] for query in queries).upper()
+        self.assertNotIn("COUNT(", sql)
+        self.assertNotIn("OFFSET", sql)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_numbers_still_work(self):
+        response = self.client.get(self.url, {"page": 3})
+
+        self.assertEqual(response.data["count"], 25)
+        self.assertEqual(self.descriptions(response), ["expense 4", "expense 3", "expense 2", "expense 1", "expense 0"])
+
+    def test_list_output_matches_expense_serializer(self):
+        response = self.client.get(self.url, {"page_size": 1})
+        expected = ExpenseSerializer(self.expenses[-1]).data
+
+        self.assertEqual(response.json()["results"], [json.loads(json.dumps(expected, cls=JSONEncoder))])
+
+    def test_query_count_is_constant_per_page(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {"page_size": 10})
+        self.assertEqual(len(response.data["results"]), 10)
+
+
+class ExpenseIndexUsageTests(TestCase):
+    """
+    Seed a few users with enough expenses for the planner to prefer indexes,
+    then check with EXPLAIN that each list filter is served by the index
+    declared for it.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                first_name="test",
+                last_name="user",
+                email=f"index{i}@mail.com",
+                password="testuser",
+            )
+            for i in range(10)
+        ]
+        categories = [
+            Category.objects.create(name=f"Category {i}", owner=user)
+            for user in cls.users
+            for i in range(5)
+        ]
+        start = date(2020, 1, 1)
+        Expense.objects.bulk_create(
+            [
+                Expense(
+                    category=category,
+                    owner_id=category.owner_id,
+                    amount=(i % 500) * 100 + 99,
+                    description=f"expense {i}",
+                    created_at=start + timedelta(days=i % 1000),
+                )
+                for category in categories
+                for i in range(100)
+            ]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.user = cls.users[0]
+        cls.category = categories[0]
+
+    def list_query(self, **params):
+        filters = ExpenseFilterSerializer(data=params, context={"user": self.user})
+        filters.is_valid(raise_exception=True)
+        expenses = filters.filter_queryset(Expense.objects.filter(owner=self.user))
+        return expenses.order_by(*filters.get_ordering())[:11]
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan)
+
+    def test_default_list_uses_owner_created_index(self):
+        self.assertUsesIndex(self.list_query(), "expense_owner_created_idx")
+
+    def test_date_window_uses_owner_created_index(self):
+        query = self.list_query(start_date="2021-01-01", end_date="2021-03-01")
+        self.assertUsesIndex(query, "expense_owner_created_idx")
+
+    def test_amount_ordering_uses_owner_amount_index(self):
+        query = self.list_query(ordering="-amount", min_amount="100", max_amount="200")
+        self.assertUsesIndex(query, "expense_owner_amount_idx")
+
+    def test_category_filter_uses_category_created_index(self):
+        query = self.list_query(category=self.category.public_id)
+        self.assertUsesIndex(query, "expense_category_created_idx")
+
+    def test_category_detail_uses_category_created_index(self):
+        query = self.category.expenses.order_by("-created_at", "-id")[:11]
+        self.assertUsesIndex(query, "expense_category_created_idx")
+
+
+class ExpenseListFilterTests(TestCase):
+    url = "/api/v1/expenses/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user)
+        self.rent = Category.objects.create(name="Rent", owner=self.user)
+        for category, amount in [(self.food, 500), (self.food, 5000), (self.rent, 50000)]:
+            Expense.objects.create(
+                category=category, amount=amount, description="test", owner=self.user
+            )
+
+    def amounts(self, **params):
+        response = self.client.get(self.url, params)
+        return [expense["amount"] for expense in response.data["results"]]
+
+    def test_amount_range_and_ordering(self):
+        self.assertEqual(self.amounts(ordering="amount"), ["5.00", "50.00", "500.00"])
+        self.assertEqual(
+            self.amounts(ordering="-amount", min_amount="10", max_amount="100"), ["50.00"]
+        )
+
+    def test_category_filter(self):
+        self.assertEqual(self.amounts(category=self.rent.public_id), ["500.00"])
+        self.assertEqual(self.amounts(category="unknown"), [])
+
+    def test_date_filters(self):
+        today = date.today()
+        self.assertEqual(len(self.amounts(start_date=today.isoformat())), 3)
+        self.assertEqual(self.amounts(end_date=(today - timedelta(days=1)).isoformat()), [])
+
+    def test_invalid_filters(self):
+        response = self.client.get(self.url, {"min_amount": "10", "max_amount": "1"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {"ordering": "description"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ExpenseSearchTests(TestCase):
+    url = "/api/v1/expenses/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        food = Category.objects.create(name="Groceries", owner=self.user)
+        travel = Category.objects.create(name="Travel", owner=self.user)
+        for category, description in [
+            (food, "weekly market run"),
+            (food, "bakery"),
+            (travel, "train to the market"),
+            (travel, "taxi"),
+        ]:
+            Expense.objects.create(
+                category=category, amount=1000, description=description, owner=self.user
+            )
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {"query": query, **params})
+        return [expense["description"] for expense in response.data["results"]]
+
+    def test_matches_descriptions(self):
+        self.assertEqual(
+            sorted(self.search("market")), ["train to the market", "weekly market run"]
+        )
+
+    def test_matches_category_names(self):
+        self.assertEqual(sorted(self.search("grocer")), ["bakery", "weekly market run"])
+
+    def test_category_and_description_matches_rank_first(self):
+        Expense.objects.create(
+            category=Category.objects.get(name="Travel"),
+            amount=100,
+            description="travel insurance",
+            owner=self.user,
+        )
+        self.assertEqual(self.search("travel")[0], "travel insurance")
+
+    def test_ranked_results_are_paginated(self):
+        first = self.client.get(self.url, {"query": "market", "page_size": 1})
+        second = self.client.get(first.data["next"])
+
+        results = first.data["results"] + second.data["results"]
+        self.assertEqual(len({expense["description"] for expense in results}), 2)
+        self.assertIsNone(second.data["next"])
+
+    def test_other_orderings_still_apply(self):
+        self.assertEqual(
+            self.search("market", ordering="created_at"),
+            ["weekly market run", "train to the market"],
+        )
+
+    def test_relevance_needs_a_query(self):
+        response = self.client.get(self.url, {"ordering": "relevance"})
+        self.assertEqual(response.status_code, 400)
+
+    @skipUnless(connection.vendor == "postgresql", "search indexes are PostgreSQL only")
+    def test_search_uses_gin_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("pg_trgm is not available")
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        expenses = search_expenses(Expense.objects.filter(owner=self.user), self.user, "markets")
+
+        plan = expenses.explain()
+        self.assertIn("expense_description_fts_idx", plan)
+        self.assertIn("expense_description_trgm_idx", plan)
+        self.assertEqual(expenses.count(), 2)
+
+
+class ExpenseBulkCreateTests(TestCase):
+    url = "/api/v1/expenses/bulk/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user, limit=3000)
+
+    def item(self, category, amount, description="synced"):
+        return {"category": {"name": category}, "amount": amount, "description": description}
+
+    def test_creates_expenses_and_missing_categories(self):
+        items = [self.item("Food", "10.00"), self.item("Travel", "5.00"), self.item("Travel", "7.00")]
+        response = self.client.post(self.url, {"expenses": items}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 3)
+        self.assertEqual(
+            [result["data"]["amount"] for result in response.data["results"]],
+            ["10.00", "5.00", "7.00"],
+        )
+        travel = Category.objects.get(name="Travel", owner=self.user)
+        self.assertEqual(travel.total_spent, 1200)
+        self.assertEqual(travel.expenses.count(), 2)
+
+    def test_reports_invalid_items_and_limits_per_item(self):
+        items = [
+            self.item("Food", "20.00"),
+            self.item("Food", "-1.00"),
+            self.item("Food", "15.00"),
+            self.item("Food", "10.00"),
+        ]
+        response = self.client.post(self.url, {"expenses": items}, format="json")
+
+        statuses = [result["status"] for result in response.data["results"]]
+        self.assertEqual(statuses, ["created", "error", "error", "created"])
+        self.assertIn("amount", response.data["results"][1]["errors"])
+        self.assertEqual(response.data["results"][2]["errors"], {"error": "Limit has been reached"})
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 3000)
+
+    def test_query_count_does_not_grow_with_items(self):
+        def post(count):
+            items = [self.item(name, "1.00") for name in ["Food", "Travel", "Rent"]] * count
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(self.url, {"expenses": items}, format="json")
+            Category.objects.exclude(pk=self.food.pk).delete()
+            return len(queries)
+
+        post(1)  # creates the rollup row of the existing category
+        self.assertEqual(post(2), post(50))
+
+    def test_nothing_created(self):
+        response = self.client.post(self.url, {"expenses": [self.item("Food", "0")]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {"expenses": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+
+class ExpenseBulkUpdateDeleteTests(TestCase):
+    url = "/api/v1/expenses/bulk/selection/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user, limit=10000)
+        self.taxi = [
+            Expense.objects.create(category=self.food, owner=self.user, amount=1000, description="taxi home")
+            for _ in range(3)
+        ]
+        self.lunch = Expense.objects.create(
+            category=self.food, owner=self.user, amount=2000, description="lunch"
+        )
+
+    def daily_totals(self):
+        return {
+            row.category.name: (row.total, row.count)
+            for row in DailySpend.objects.filter(owner=self.user).select_related("category")
+        }
+
+    def test_moves_filtered_expenses_to_a_new_category(self):
+        response = self.client.patch(
+            self.url, {"filter": {"query": "taxi"}, "category": "Travel"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"updated": 3})
+        travel = Category.objects.get(owner=self.user, name="Travel")
+        self.food.refresh_from_db()
+        self.assertEqual(travel.total_spent, 3000)
+        self.assertEqual(self.food.total_spent, 2000)
+        self.assertEqual(
+            self.daily_totals(),
+            {"Food": (2000, 1), "Travel": (3000, 3)},
+        )
+
+    def test_sets_amount_of_selected_ids(self):
+        ids = [expense.public_id for expense in self.taxi[:2]]
+        response = self.client.patch(self.url, {"ids": ids, "amount": "15.00"}, format="json")
+
+        self.assertEqual(response.data, {"updated": 2})
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 6000)
+        self.assertEqual(self.daily_totals(), {"Food": (6000, 4)})
+
+    def test_update_over_limit_is_rejected(self):
+        response = self.client.patch(
+            self.url, {"filter": {"query": "taxi"}, "amount": "30.00"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Expense.objects.filter(amount=3000).count(), 0)
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 5000)
+
+    def test_deletes_selected_expenses(self):
+        response = self.client.delete(self.url, {"filter": {"query": "taxi"}}, format="json")
+
+        self.assertEqual(response.data, {"deleted": 3})
+        self.assertEqual(list(Expense.objects.filter(owner=self.user)), [self.lunch])
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 2000)
+        self.assertEqual(self.daily_totals(), {"Food": (2000, 1)})
+
+    def test_each_write_is_one_statement(self):
+        def writes(request, statement):
+            with CaptureQueriesContext(connection) as queries:
+                response = request()
+            table = connection.ops.quote_name(Expense._meta.db_table)
+            return response, [query for query in queries if query["sql"].startswith(f"{statement} {table}")]
+
+        response, updates = writes(
+            lambda: self.client.patch(self.url, {"filter": {"query": "taxi"}, "amount": "5.00"}, format="json"),
+            "UPDATE",
+        )
+        self.assertEqual((response.data, len(updates)), ({"updated": 3}, 1))
+        response, deletes = writes(lambda: self.client.delete(self.url, {"filter": {}}, format="json"), "DELETE FROM")
+        self.assertEqual((response.data, len(deletes)), ({"deleted": 4}, 1))
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 0)
+        self.assertEqual(self.daily_totals(), {})
+
+    def test_selection_over_the_limit_is_rejected(self):
+        with mock.patch.object(ExpenseSelectionSerializer, "max_items", 3):
+            response = self.client.delete(self.url, {"filter": {}}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Expense.objects.filter(owner=self.user).count(), 4)
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 5000)
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_selection_is_locked_before_it_is_counted(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.delete(self.url, {"filter": {"query": "taxi"}}, format="json")
+        statements = [query["sql"] for query in queries]
+        locked = next(i for i, sql in enumerate(statements) if "FOR UPDATE" in sql)
+        counted = next(i for i, sql in enumerate(statements) if "SUM(" in sql)
+        self.assertLess(locked, counted)
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_categories_are_locked_before_the_selection(self):
+        # the order single expense writes take the locks in
+        category_table = Category._meta.db_table
+        for request in [
+            lambda: self.client.patch(self.url, {"filter": {"query": "taxi"}, "category": "Travel"}, format="json"),
+            lambda: self.client.delete(self.url, {"filter": {"query": "taxi"}}, format="json"),
+        ]:
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            locks = [query["sql"] for query in queries if "FOR UPDATE" in query["sql"]]
+            self.assertIn(category_table, locks[0].split(" WHERE ")[0])
+            self.assertNotIn(category_table, locks[1].split(" WHERE ")[0])
+
+    def test_only_touches_own_expenses(self):
+        other = create_user(email="other@example.com")
+        category = Category.objects.create(name="Food", owner=other)
+        expense = Expense.objects.create(category=category, owner=other, amount=500, description="taxi")
+
+        response = self.client.delete(self.url, {"ids": [expense.public_id, self.lunch.public_id]}, format="json")
+
+        self.assertEqual(response.data, {"deleted": 1})
+        self.assertTrue(Expense.objects.filter(pk=expense.pk).exists())
+
+    def test_requires_a_selection(self):
+        for payload in [{"amount": "5.00"}, {"ids": [self.lunch.public_id], "filter": {}, "amount": "5.00"}]:
+            response = self.client.patch(self.url, payload, format="json")
+            self.assertEqual(response.status_code, 400)
+        response = self.client.patch(self.url, {"ids": [self.lunch.public_id]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+class ExpenseImportTests(TestCase):
+    url = "/api/v1/expenses/import/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, name, content, **data):
+        file = SimpleUploadedFile(name, content.encode("utf-8"))
+        return self.client.post(self.url, {"file": file, **data}, format="multipart")
+
+    def test_csv_import_maps_columns_and_reports_errors(self):
+        content = (
+            "Date,Amount,Memo,Type\r\n"
+            "2023-01-05,12.50,Lunch,Food\r\n"
+            "2023-01-06,-3,Refund,Food\r\n"
+            "2023-01-07,40.00,\"Train, return\",Travel\r\n"
+            "07/01/2023,1.00,Coffee,Food\r\n"
+        )
+        response = self.upload(
+            "statement.csv",
+            content,
+            date_column="Date",
+            amount_column="Amount",
+            description_column="Memo",
+            category_column="Type",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["rows"], response.data["created"]), (4, 2))
+        self.assertEqual([error["row"] for error in response.data["errors"]], [3, 5])
+        train = Expense.objects.get(description="Train, return")
+        self.assertEqual(train.created_at, date(2023, 1, 7))
+        self.assertEqual(train.category.name, "Travel")
+        self.assertEqual(Category.objects.get(name="Food").total_spent, 1250)
+
+    def test_jsonl_import(self):
+        content = (
+            '{"date": "2023-02-01", "amount": 9.99, "description": "Book", "category": "Fun"}\n'
+            "not json\n"
+            '{"amount": "5", "description": "Snack"}\n'
+        )
+        response = self.upload("history.jsonl", content)
+
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["errors"], [{"row": 2, "errors": {"error": "Invalid JSON"}}])
+        self.assertEqual(Expense.objects.get(description="Snack").category.name, "Imported")
+
+    def test_ofx_import_keeps_debits_only(self):
+        content = (
+            "OFXHEADER:100\nDATA:OFXSGML\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>"
+            "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20230301120000<TRNAMT>-25.00<NAME>GROCER"
+            "<MEMO>Weekly shop</STMTTRN>"
+            "<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20230302<TRNAMT>1000.00<NAME>SALARY</STMTTRN>"
+            "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>"
+        )
+        response = self.upload("bank.ofx", content, default_category="Bank")
+
+        self.assertEqual(response.data["created"], 1)
+        expense = Expense.objects.get()
+        self.assertEqual(
+            (expense.description, expense.amount, expense.created_at, expense.category.name),
+            ("Weekly shop", 2500, date(2023, 3, 1), "Bank"),
+        )
+
+    def test_ofx_dates_ignore_the_date_format(self):
+        content = (
+            "<OFX><BANKTRANLIST>"
+            "<STMTTRN><DTPOSTED>20230301<TRNAMT>-5.00<NAME>CAFE</STMTTRN>"
+            "<STMTTRN><DTPOSTED>2023-03<TRNAMT>-5.00<NAME>CAFE</STMTTRN>"
+            "</BANKTRANLIST></OFX>"
+        )
+        response = self.upload("bank.ofx", content, date_format="%d/%m/%Y")
+
+        self.assertEqual((response.data["created"], response.data["failed"]), (1, 1))
+        self.assertEqual(Expense.objects.get().created_at, date(2023, 3, 1))
+
+    def test_ofx_rows_with_non_finite_amounts_are_rejected(self):
+        content = (
+            "<OFX><BANKTRANLIST>"
+            "<STMTTRN><DTPOSTED>20230301<TRNAMT>NaN<NAME>BROKEN</STMTTRN>"
+            "<STMTTRN><DTPOSTED>20230301<TRNAMT>-Infinity<NAME>BROKEN</STMTTRN>"
+            "<STMTTRN><DTPOSTED>20230302<TRNAMT>-5.00<NAME>CAFE</STMTTRN>"
+            "</BANKTRANLIST></OFX>"
+        )
+        response = self.upload("bank.ofx", content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["failed"]), (1, 2))
+
+    def test_unknown_format(self):
+        response = self.upload("statement.xls", "")
+        self.assertEqual(response.status_code, 400)
+
+    def test_parsers_handle_rows_split_across_chunks(self):
+        content = "date,amount,description,category\n" + "".join(
+            f"2023-01-{i % 28 + 1:02d},{i}.25,\"item, {i}\",Cat {i % 3}\n" for i in range(1, 200)
+        )
+        chunks = [content[i : i + 7] for i in range(0, len(content), 7)]
+        rows = list(parse_csv(chunks, ImportColumns()))
+
+        self.assertEqual(len(rows), 199)
+        self.assertEqual(rows[-1][1]["description"], "item, 199")
+
+    def test_command_imports_in_batches(self):
+        content = "date,amount,description,category\n" + "".join(
+            f"2023-01-01,1.00,row {i},Food\n" for i in range(25)
+        )
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write(content)
+            file.flush()
+            with CaptureQueriesContext(connection) as queries:
+                call_command(
+                    "import_expenses", file.name, user=self.user.email, batch_size=10, stdout=StringIO()
+                )
+
+        self.assertEqual(Expense.objects.filter(owner=self.user).count(), 25)
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "expenses_expense"')]
+        self.assertEqual(len(inserts), 3)
+
+    @skipUnlessDBFeature("has_select_for_update")
+    def test_existing_categories_are_locked(self):
+        food = Category.objects.create(name="Food", owner=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.upload("history.jsonl", '{"amount": "5", "description": "Snack", "category": "Food"}\n')
+
+        self.assertEqual(Expense.objects.get(description="Snack").category, food)
+        locks = [q["sql"] for q in queries if "FOR UPDATE" in q["sql"]]
+        self.assertIn(Category._meta.db_table, locks[0])
+
+
+class ExpenseExportTests(TestCase):
+    url = "/api/v1/expenses/export/"
+
+    def setUp(self):
+        self.user = create_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        food = Category.objects.create(name="Food", owner=self.user)
+        for day, amount, description in [(1, 1250, "Lunch, late"), (2, 300, "Coffee")]:
+            Expense.objects.create(
+                category=food,
+                amount=amount,
+                description=description,
+                owner=self.user,
+                created_at=date(2023, 1, day),
+            )
+
+    def content(self, response):
+        return b"".join(response.streaming_content)
+
+    def test_csv_export(self):
+        response = self.client.get(self.url)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(
+            self.content(response).decode().splitlines(),
+            [
+                "date,category,amount,description",
+                '2023-01-01,Food,12.50,"Lunch, late"',
+                "2023-01-02,Food,3.00,Coffee",
+            ],
+        )
+
+    def test_jsonl_export_with_date_range(self):
+        response = self.client.get(self.url, {"file_type": "jsonl", "start_date": "2023-01-02"})
+
+        lines = self.content(response).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"date": "2023-01-02", "category": "Food", "amount": "3.00", "description": "Coffee"}],
+        )
+
+    def test_gzip_export(self):
+        response = self.client.get(self.url, {"gzip": "true"})
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="expenses.csv.gz"', response["Content-Disposition"])
+        self.assertEqual(gzip.decompress(self.content(response)).decode().count("\n"), 3)
+
+    def test_first_chunk_is_sent_before_the_query_runs(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            first = next(iter(response.streaming_content))
+        self.assertEqual(first, b"date,category,amount,description\r\n")
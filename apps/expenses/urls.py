@@ -1,6 +1,10 @@
 from django.urls import path
 from .views import (
     ExpenseListCreateAPIView, 
+    ExpenseBulkCreateAPIView,
+    ExpenseBulkUpdateDeleteAPIView,
+    ExpenseImportAPIView,
+    ExpenseExportAPIView,
     ExpenseDetailAPIView,
     CategoryListCreateAPIView,
     CategoryDetailAPIView,
@@ -9,10 +13,14 @@ from .views import (
 
 urlpatterns = [
     path('expenses/', ExpenseListCreateAPIView.as_view()),
-    path('expenses/<slug>/', ExpenseDetailAPIView.as_view()),
+    path('expenses/bulk/', ExpenseBulkCreateAPIView.as_view()),
+    path('expenses/bulk/selection/', ExpenseBulkUpdateDeleteAPIView.as_view()),
+    path('expenses/import/', ExpenseImportAPIView.as_view()),
+    path('expenses/export/', ExpenseExportAPIView.as_view()),
+    path('expenses/<str:public_id>/', ExpenseDetailAPIView.as_view()),
 
     path('categories/', CategoryListCreateAPIView.as_view()),
-    path('categories/<slug>/', CategoryDetailAPIView.as_view()),
-    path('categories/<slug>/set-limit/', CategorySpendLimitAPIView.as_view())
+    path('categories/<str:public_id>/', CategoryDetailAPIView.as_view()),
+    path('categories/<str:public_id>/set-limit/', CategorySpendLimitAPIView.as_view())
 
 ]
\ No newline at end of file
@@ -1,23 +1,38 @@
+from django.db import transaction
 from django.shortcuts import redirect, get_object_or_404
 from django.views import View
-from django.db.models import Q
+from django.http import StreamingHttpResponse
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import FormParser, MultiPartParser
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiExample
 from datetime import date
 
 from .serializers import (
+    BulkExpenseSerializer,
+    BulkExpenseUpdateSerializer,
+    BulkExpenseDeleteSerializer,
+    ExpenseSelectionSerializer,
     ExpenseSerializer,
+    ExpenseListSerializer,
     CategorySerializer,
     CategoryDetailSerializer,
     CategoryLimitSerializer,
+    DateWindowSerializer,
+    ExpenseFilterSerializer,
+    ExpenseImportSerializer,
+    ExpenseExportSerializer,
 )
 from renderers import UserRenderer
+from apps.common.cache import stats_cache
 from .models import Expense, Category
+from .exporters import export_expenses
+from .importers import ExpenseImporter, ImportColumns
+from .pagination import KeysetPagination
 from .permissions import IsOwner
 
 tags = [
@@ -26,48 +41,110 @@ tags = [
 ]
 
 
-class ExpenseListCreateAPIView(APIView, PageNumberPagination):
+class ExpenseListCreateAPIView(APIView):
     serializer_class = ExpenseSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
 
     @extend_schema(
         tags=tags[0],
         summary="Expenses list",
-        description="This endpoint returns all user's expenses",
+        description="""
+            This endpoint returns all user's expenses, newest first. Pages are walked
+            with the `next` and `previous` cursors; passing `page` switches to the
+            older page number pagination
+            """,
         request=ExpenseSerializer,
         responses={"200": ExpenseSerializer},
         parameters=[
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                required=False,
+                description="Page cursor, taken from `next` or `previous`",
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=int,
+                required=False,
+                description="Number of expenses per page (max 100)",
+            ),
+            OpenApiParameter(
+                name="count",
+                type=bool,
+                required=False,
+                description="Also return the total number of matching expenses",
+            ),
             OpenApiParameter(
                 name="page",
                 type=int,
                 required=False,
-                description="Page number",
+                description="Page number (deprecated, use `cursor`)",
             ),
             OpenApiParameter(
                 name="query",
                 type=str,
                 required=False,
-                description="category name or expense description",
+                description="Search the expense descriptions and category names",
+            ),
+            OpenApiParameter(
+                name="start_date",
+                type=date,
+                required=False,
+                description="Only list expenses created on or after this date",
+            ),
+            OpenApiParameter(
+                name="end_date",
+                type=date,
+                required=False,
+                description="Only list expenses created on or before this date",
+            ),
+            OpenApiParameter(
+                name="min_amount",
+                type=float,
+                required=False,
+                description="Only list expenses of at least this amount",
+            ),
+            OpenApiParameter(
+                name="max_amount",
+                type=float,
+                required=False,
+                description="Only list expenses of at most this amount",
+            ),
+            OpenApiParameter(
+                name="category",
+                type=str,
+                required=False,
+                description="Id of the category to list expenses for",
+            ),
+            OpenApiParameter(
+                name="ordering",
+                type=str,
+                required=False,
+                description="Sort order, newest first by default or by relevance when searching",
+                enum=list(ExpenseFilterSerializer.ORDERINGS),
             ),
         ],
     )
     def get(self, request):
-
-        query = self.request.GET.get("query")
-        if query == None:
-            query = ""
-
         user = self.request.user
-        expenses = Expense.objects.all().filter(
-            Q(description__icontains=query), owner=user
-        )
-        # set the number if objects to be returned per page
-        self.page_size = 10
-        # from the PageNumberPagination class, paginate the queyset
-        result = self.paginate_queryset(expenses, request, view=self)
+        filters = ExpenseFilterSerializer(data=request.query_params, context={"user": user})
+        filters.is_valid(raise_exception=True)
+
+        expenses = Expense.objects.select_related("category").filter(owner=user)
+        expenses = filters.filter_queryset(expenses)
+        if "page" in request.query_params:
+            # page numbers are still served for older clients
+            paginator = PageNumberPagination()
+            paginator.page_size = 10
+            expenses = expenses.order_by(*filters.get_ordering())
+        else:
+            paginator = self.pagination_class()
+            paginator.ordering = filters.get_ordering()
+        result = paginator.paginate_queryset(expenses, request, view=self)
         # Serialize the paginated resukts
-        serializer = self.serializer_class(result, many=True)
-        return self.get_paginated_response(serializer.data)
+        serializer = ExpenseListSerializer(result, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @extend_schema(
         tags=tags[0],
@@ -91,10 +168,188 @@ class ExpenseListCreateAPIView(APIView, PageNumberPagination):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class ExpenseBulkCreateAPIView(APIView):
+    serializer_class = BulkExpenseSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags[0],
+        summary="Bulk create expenses",
+        description=f"""
+            This endpoint creates up to {BulkExpenseSerializer.max_items} expenses in one request
+            and returns a result per item, in the order they were sent. Items that fail
+            validation or would go over their category's limit are reported as errors
+            while the others are created
+            """,
+        request=BulkExpenseSerializer,
+        examples=[
+            OpenApiExample(
+                name="Bulk create example",
+                value={
+                    "expenses": [
+                        {"category": {"name": "Food"}, "amount": "12.50", "description": "Lunch"},
+                        {"category": {"name": "Travel"}, "amount": "3.20", "description": "Bus"},
+                    ]
+                },
+            )
+        ],
+    )
+    def post(self, request):
+        user = request.user
+        serializer = self.serializer_class(data=request.data, context={"user": user})
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+
+        created = sum(1 for result in results if result["status"] == "created")
+        return Response(
+            {"created": created, "failed": len(results) - created, "results": results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
+
+class ExpenseBulkUpdateDeleteAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags[0],
+        summary="Bulk update expenses",
+        description=f"""
+            This endpoint moves the selected expenses to another category and/or sets
+            their amount, and returns how many were updated. Up to
+            {ExpenseSelectionSerializer.max_items} expenses are selected either by `ids` or with a
+            `filter` taking the same fields as the expenses list query parameters. The whole
+            update is rejected if it would go over a category's limit
+            """,
+        request=BulkExpenseUpdateSerializer,
+        examples=[
+            OpenApiExample(
+                name="Bulk update example",
+                value={"filter": {"query": "taxi", "start_date": "2024-01-01"}, "category": "Travel"},
+            )
+        ],
+    )
+    def patch(self, request):
+        serializer = BulkExpenseUpdateSerializer(data=request.data, context={"user": request.user})
+        serializer.is_valid(raise_exception=True)
+        updated = serializer.save()
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+    @extend_schema(
+        tags=tags[0],
+        summary="Bulk delete expenses",
+        description=f"""
+            This endpoint deletes the selected expenses and returns how many were deleted.
+            Up to {ExpenseSelectionSerializer.max_items} expenses are selected either by `ids` or
+            with a `filter` taking the same fields as the expenses list query parameters
+            """,
+        request=BulkExpenseDeleteSerializer,
+        examples=[
+            OpenApiExample(
+                name="Bulk delete example",
+                value={"ids": ["pO0Hh2kW3mA", "Z7rQe1xYb_c"]},
+            )
+        ],
+    )
+    def delete(self, request):
+        serializer = BulkExpenseDeleteSerializer(data=request.data, context={"user": request.user})
+        serializer.is_valid(raise_exception=True)
+        deleted = serializer.save()
+        return Response({"deleted": deleted}, status=status.HTTP_200_OK)
+
+
+class ExpenseImportAPIView(APIView):
+    serializer_class = ExpenseImportSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    @extend_schema(
+        tags=tags[0],
+        summary="Import expenses",
+        description="""
+            This endpoint imports expenses from an uploaded CSV, JSON-lines or OFX statement.
+            The file is streamed and inserted in batches. The response reports how many rows
+            were imported, the throughput and the first row-level errors
+            """,
+        request={"multipart/form-data": ExpenseImportSerializer},
+    )
+    def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        columns = ImportColumns(
+            date=data["date_column"],
+            amount=data["amount_column"],
+            description=data["description_column"],
+            category=data["category_column"],
+            date_format=data["date_format"],
+            default_category=data["default_category"],
+        )
+        report = ExpenseImporter(request.user, columns).run(data["file"], data["format"])
+        return Response(report.as_dict(), status=status.HTTP_201_CREATED)
+
+
+class ExpenseExportAPIView(APIView):
+    serializer_class = ExpenseExportSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags[0],
+        summary="Export expenses",
+        description="""
+            This endpoint streams all the user's expenses, oldest first, as CSV or JSON lines.
+            The export can be restricted to a date range and gzip-compressed
+            """,
+        parameters=[
+            OpenApiParameter(
+                name="file_type",
+                type=str,
+                required=False,
+                enum=["csv", "jsonl"],
+                description="Export format, csv by default",
+            ),
+            OpenApiParameter(
+                name="gzip",
+                type=bool,
+                required=False,
+                description="Compress the export with gzip",
+            ),
+            OpenApiParameter(
+                name="start_date",
+                type=date,
+                required=False,
+                description="Only export expenses created on or after this date",
+            ),
+            OpenApiParameter(
+                name="end_date",
+                type=date,
+                required=False,
+                description="Only export expenses created on or before this date",
+            ),
+        ],
+        responses={(200, "text/csv"): str, (200, "application/x-ndjson"): str},
+    )
+    def get(self, request):
+        options = self.serializer_class(data=request.query_params)
+        options.is_valid(raise_exception=True)
+        file_type = options.validated_data["file_type"]
+        compress = options.validated_data["gzip"]
+
+        chunks, content_type = export_expenses(
+            request.user, file_type, window=options, gzip=compress
+        )
+        filename = f"expenses.{file_type}" + (".gz" if compress else "")
+        response = StreamingHttpResponse(
+            chunks, content_type="application/gzip" if compress else content_type
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
 class ExpenseDetailAPIView(APIView):
     serializer_class = ExpenseSerializer
     permission_classes = [IsAuthenticated, IsOwner]
-    lookup_field = "slug"
+    lookup_field = "public_id"
 
     @extend_schema(
         tags=tags[0],
@@ -103,8 +358,10 @@ class ExpenseDetailAPIView(APIView):
         request=ExpenseSerializer,
         responses={"200": ExpenseSerializer},
     )
-    def get(self, request, slug):
-        expense = Expense.objects.get(slug=slug)
+    def get(self, request, public_id):
+        expense = get_object_or_404(
+            Expense.objects.select_related("category"), owner=request.user, public_id=public_id
+        )
         serializer = self.serializer_class(expense)
         return Response(serializer.data)
 
@@ -115,8 +372,10 @@ class ExpenseDetailAPIView(APIView):
         request=ExpenseSerializer,
         responses={"200": ExpenseSerializer},
     )
-    def put(self, request, slug):
-        expense = Expense.objects.get(slug=slug)
+    def put(self, request, public_id):
+        expense = get_object_or_404(
+            Expense.objects.select_related("category"), owner=request.user, public_id=public_id
+        )
         serializer = self.serializer_class(expense, data=request.data)
         if serializer.is_valid():
             serializer.save()
@@ -130,9 +389,12 @@ class ExpenseDetailAPIView(APIView):
         request=ExpenseSerializer,
         responses={"200": ExpenseSerializer},
     )
-    def delete(self, request, slug):
-        expense = Expense.objects.get(slug=slug)
-        expense.delete()
+    def delete(self, request, public_id):
+        expense = get_object_or_404(Expense, owner=request.user, public_id=public_id)
+        with transaction.atomic():
+            # the category is locked before the expense row, like updates and bulk writes
+            Category.objects.select_for_update().get(pk=expense.category_id)
+            expense.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -175,37 +437,112 @@ class CategoryListCreateAPIView(APIView):
 class CategoryDetailAPIView(APIView):
     serializer_class = CategoryDetailSerializer
     permission_classes = [IsAuthenticated, IsOwner]
-    lookup_field = "slug"
+    pagination_class = KeysetPagination
+    lookup_field = "public_id"
 
     @extend_schema(
         tags=tags[1],
         summary="Category detail",
-        description="This endpoint retreives the category details",
+        description="""
+            This endpoint retreives the category details. The count, total and difference
+            from limit cover every expense of the category, while the expenses are returned
+            a page at a time, newest first
+            """,
         request=CategoryDetailSerializer,
         responses={"200": CategoryDetailSerializer},
+        parameters=[
+            OpenApiParameter(
+                name="cursor",
+                type=str,
+                required=False,
+                description="Cursor of the page of expenses, taken from `next` or `previous`",
+            ),
+            OpenApiParameter(
+                name="page_size",
+                type=int,
+                required=False,
+                description="Number of expenses per page (max 100)",
+            ),
+            OpenApiParameter(
+                name="start_date",
+                type=date,
+                required=False,
+                description="Only list expenses created on or after this date",
+            ),
+            OpenApiParameter(
+                name="end_date",
+                type=date,
+                required=False,
+                description="Only list expenses created on or before this date",
+            ),
+        ],
     )
-    def get(self, request, slug):
+    def get(self, request, public_id):
+        window = DateWindowSerializer(data=request.query_params)
+        window.is_valid(raise_exception=True)
         try:
-            category = Category.objects.prefetch_related("expenses").get(slug=slug)
-
-            serializer = self.serializer_class(category)
-            return Response({"data": serializer.data})
+            category = self.get_category(request.user, public_id)
         except Category.DoesNotExist:
-            return Response({"error":f'category with the slug "{slug}" not found'})
+            return Response(
+                {"error": f'category with the id "{public_id}" not found'},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        expenses = window.filter_queryset(category.expenses.all())
+        paginator = self.pagination_class()
+        category.expense_page = paginator.paginate_queryset(expenses, request, view=self)
+
+        serializer = self.serializer_class(category)
+        return Response(
+            {
+                "data": {
+                    **serializer.data,
+                    "next": paginator.get_next_link(),
+                    "previous": paginator.get_previous_link(),
+                }
+            }
+        )
+
+
+    def get_category(self, user, public_id):
+        """
+        Fetch the category with its expense count and total. The aggregates
+        are cached until the user's data changes, so a hit is a plain lookup.
+        """
+        fetched = []
+
+        def compute():
+            category = Category.objects.with_totals().get(owner=user, public_id=public_id)
+            fetched.append(category)
+            return category.expense_count, category.expense_total
+
+        totals = stats_cache.get_or_compute(user.pk, f"category-totals:{public_id}", compute)
+        if fetched:
+            return fetched[0]
+        category = Category.objects.get(owner=user, public_id=public_id)
+        category.expense_count, category.expense_total = totals
+        return category
 
 
 class CategorySpendLimitAPIView(APIView):
     serializer_class = CategoryLimitSerializer
+    permission_classes = [IsAuthenticated]
 
     @extend_schema(
         tags=tags[1],
         summary="Category Limit",
-        description="This endpoint sets the spend limit for a category",
+        description="""
+            This endpoint sets the spend limit for a category. By default the limit caps
+            everything ever spent in the category; with `limit_period` set to `week`,
+            `month` or `custom` it only caps the spend of the current window, which
+            resets on `limit_anchor` (every `limit_period_days` days for custom periods).
+            `window` is the current window
+            """,
         request=CategoryLimitSerializer,
         responses={"200": CategoryLimitSerializer},
     )
-    def patch(self, request, slug):
-        category = get_object_or_404(Category, slug=slug)
+    def patch(self, request, public_id):
+        category = get_object_or_404(Category, owner=request.user, public_id=public_id)
         serializer = self.serializer_class(category, data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save()
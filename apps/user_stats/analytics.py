@@ -0,0 +1,153 @@
+"""
+Top-N and percentile spend analytics for one user and date range.
+
+Three queries whatever the amount of data:
+
+- the largest expenses, an ORDER BY amount with a LIMIT
+- the categories ranked by spend with their share of the total, one
+  grouped query over the DailySpend rollup where the rank and the grand
+  total are window functions over the per-category sums
+- the median and 90th percentile expense size per category
+
+PostgresSpendAnalytics computes the percentiles in the database with the
+percentile_cont ordered-set aggregate. SQLite (local development and
+tests) has no ordered-set aggregates, so SimpleSpendAnalytics reads the
+amounts of the range and interpolates them the same way with NumPy.
+"""
+from decimal import Decimal
+
+import numpy as np
+from django.db import connection
+from django.db.models import Aggregate, BigIntegerField, Count, F, FloatField, Func, Sum, Window
+from django.db.models.functions import Rank
+
+from apps.expenses.models import Expense
+from apps.expenses.money import from_cents
+from apps.expenses.serializers import ExpenseListSerializer
+from .models import DailySpend
+
+PERCENTILES = {"median": 0.5, "p90": 0.9}
+
+
+class WindowSum(Func):
+    """SUM usable in a window, e.g. over a per-group aggregate"""
+
+    function = "SUM"
+    window_compatible = True
+
+
+class PercentileCont(Aggregate):
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def money(cents):
+    """Fractional cents (percentiles) rounded to an amount"""
+    return from_cents(int(round(cents)))
+
+
+def size_row(public_id, name, count, median, p90):
+    return {
+        "category": {"id": public_id, "name": name},
+        "count": count,
+        "median": money(median),
+        "p90": money(p90),
+    }
+
+
+class SimpleSpendAnalytics:
+    def expenses(self, user, start_date, end_date):
+        return Expense.objects.filter(
+            owner=user, created_at__gte=start_date, created_at__lte=end_date
+        )
+
+    def largest(self, user, start_date, end_date, limit):
+        expenses = (
+            self.expenses(user, start_date, end_date)
+            .select_related("category")
+            .order_by("-amount", "-id")[:limit]
+        )
+        return ExpenseListSerializer(expenses, many=True).data
+
+    def top_categories(self, user, start_date, end_date, limit):
+        rows = (
+            DailySpend.objects.filter(owner=user, day__gte=start_date, day__lte=end_date)
+            .values("category__public_id", "category__name")
+            .annotate(spent=Sum("total"))
+            .annotate(
+                overall=Window(WindowSum(F("spent"), output_field=BigIntegerField())),
+                rank=Window(Rank(), order_by=F("spent").desc()),
+            )
+            .order_by("rank", "category__name")[:limit]
+        )
+        return [
+            {
+                "category": {"id": row["category__public_id"], "name": row["category__name"]},
+                "rank": row["rank"],
+                "total": from_cents(row["spent"]),
+                "share": (Decimal(row["spent"]) * 100 / row["overall"]).quantize(Decimal("0.1"))
+                if row["overall"]
+                else None,
+            }
+            for row in rows
+        ]
+
+    def expense_sizes(self, user, start_date, end_date):
+        rows = (
+            self.expenses(user, start_date, end_date)
+            .order_by("category__name", "category_id")
+            .values_list("category__public_id", "category__name", "amount")
+        )
+        categories = {}
+        for public_id, name, amount in rows:
+            categories.setdefault((public_id, name), []).append(amount)
+        # linear interpolation, the same as percentile_cont
+        return [
+            size_row(
+                public_id,
+                name,
+                len(amounts),
+                *np.percentile(amounts, [100 * p for p in PERCENTILES.values()]),
+            )
+            for (public_id, name), amounts in categories.items()
+        ]
+
+
+class PostgresSpendAnalytics(SimpleSpendAnalytics):
+    def expense_sizes(self, user, start_date, end_date):
+        rows = (
+            self.expenses(user, start_date, end_date)
+            .values("category__public_id", "category__name")
+            .annotate(
+                count=Count("id"),
+                **{
+                    name: PercentileCont("amount", percentile)
+                    for name, percentile in PERCENTILES.items()
+                },
+            )
+            .order_by("category__name", "category__public_id")
+            .values_list("category__public_id", "category__name", "count", *PERCENTILES)
+        )
+        return [size_row(*row) for row in rows]
+
+
+def get_analytics_backend():
+    if connection.vendor == "postgresql":
+        return PostgresSpendAnalytics()
+    return SimpleSpendAnalytics()
+
+
+def spend_analytics(user, start_date, end_date, limit=10):
+    backend = get_analytics_backend()
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "largest_expenses": backend.largest(user, start_date, end_date, limit),
+        "top_categories": backend.top_categories(user, start_date, end_date, limit),
+        "expense_sizes": backend.expense_sizes(user, start_date, end_date),
+    }
@@ -0,0 +1,103 @@
+"""
+Spend of the current week, month or year against the previous one.
+
+Both periods are summed per category in one query: the DailySpend rollup
+is joined once over the span from the start of the previous period to
+today, and each period is a conditional sum over the joined rows. By
+default the previous period is cut at the same point as the current one
+(the first 10 days of last month against the first 10 days of this
+month); `full` compares against the whole previous period instead.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import BigIntegerField, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce
+
+from apps.expenses.models import Category
+from apps.expenses.money import from_cents
+
+PERIODS = ["week", "month", "year"]
+
+
+def period_start(day, period):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day.replace(month=1, day=1)
+
+
+def comparison_windows(period, today=None, full=False):
+    """((start, end) of the current period to date, (start, end) of the previous one)"""
+    today = today or date.today()
+    start = period_start(today, period)
+    previous_end = start - timedelta(days=1)
+    previous_start = period_start(previous_end, period)
+    if not full:
+        previous_end = min(previous_start + (today - start), previous_end)
+    return (start, today), (previous_start, previous_end)
+
+
+def change(current, previous):
+    """Absolute change in cents and the change in percent of `previous` (None when it is 0)"""
+    percent = None
+    if previous:
+        percent = (Decimal(current - previous) * 100 / previous).quantize(Decimal("0.1"))
+    return current - previous, percent
+
+
+def comparison_row(current, previous, current_count=0, previous_count=0):
+    difference, percent = change(current, previous)
+    return {
+        "current": from_cents(current),
+        "previous": from_cents(previous),
+        "change": from_cents(difference),
+        "change_percent": percent,
+        "current_count": current_count,
+        "previous_count": previous_count,
+    }
+
+
+def compare_periods(user, period="month", today=None, full=False):
+    (start, end), (previous_start, previous_end) = comparison_windows(period, today, full)
+
+    def total(field, first, last):
+        return Coalesce(
+            Sum(f"spend__{field}", filter=Q(spend__day__gte=first, spend__day__lte=last)),
+            Value(0),
+            output_field=BigIntegerField(),
+        )
+
+    rows = (
+        Category.objects.filter(owner=user)
+        .annotate(
+            spend=FilteredRelation(
+                "daily_spend",
+                condition=Q(daily_spend__day__gte=previous_start, daily_spend__day__lte=end),
+            )
+        )
+        .annotate(
+            current=total("total", start, end),
+            previous=total("total", previous_start, previous_end),
+            current_count=total("count", start, end),
+            previous_count=total("count", previous_start, previous_end),
+        )
+        .order_by("name")
+        .values_list(
+            "public_id", "name", "current", "previous", "current_count", "previous_count"
+        )
+    )
+
+    categories = []
+    totals = [0, 0, 0, 0]
+    for public_id, name, *amounts in rows:
+        categories.append({"category": {"id": public_id, "name": name}, **comparison_row(*amounts)})
+        totals = [running + amount for running, amount in zip(totals, amounts)]
+    return {
+        "period": period,
+        "current": {"start": start, "end": end},
+        "previous": {"start": previous_start, "end": previous_end},
+        "total": comparison_row(*totals),
+        "categories": categories,
+    }
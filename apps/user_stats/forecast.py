@@ -0,0 +1,144 @@
+"""
+Budget burn rate and month-end forecast for every category of a user.
+
+The daily spend of all categories over the last LOOKBACK_DAYS days is read
+from the DailySpend rollup in one query and laid out as a
+(categories x days) matrix, and every projection is then computed for all
+categories at once with NumPy:
+
+- 7 and 28 day moving averages of the daily spend
+- a least-squares linear trend of the daily spend over the whole window
+- the month-end total: spend of the month so far plus the trend (never
+  below zero) over the days left in the month
+- the day the category limit is crossed, from the spend counted against
+  the limit plus the cumulative trend, looked up to HORIZON_DAYS days ahead
+  for lifetime limits and to the end of the current window for periodic
+  ones (see apps.expenses.budgets)
+"""
+import calendar
+from datetime import date, timedelta
+
+import numpy as np
+
+from apps.expenses.budgets import limit_window, window_spent
+from apps.expenses.models import Category
+from apps.expenses.money import from_cents
+from .models import DailySpend
+
+LOOKBACK_DAYS = 90
+HORIZON_DAYS = 366
+
+
+def cents(values):
+    """Round an array of fractional cents to whole amounts"""
+    return [from_cents(int(value)) for value in np.rint(values)]
+
+
+def budget_forecast(user, today=None):
+    today = today or date.today()
+    window_start = today - timedelta(days=LOOKBACK_DAYS - 1)
+    month_start = today.replace(day=1)
+    month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
+
+    categories = list(
+        Category.objects.filter(owner=user)
+        .order_by("name")
+        .only(
+            "public_id",
+            "name",
+            "limit",
+            "total_spent",
+            "limit_period",
+            "limit_anchor",
+            "limit_period_days",
+        )
+    )
+    if not categories:
+        return []
+    rows = list(
+        DailySpend.objects.filter(owner=user, day__gte=window_start, day__lte=today)
+        .order_by()
+        .values_list("category_id", "day", "total")
+    )
+
+    position = {category.pk: index for index, category in enumerate(categories)}
+    spend = np.zeros((len(categories), LOOKBACK_DAYS))
+    if rows:
+        category_ids, days, totals = zip(*rows)
+        spend[
+            [position[pk] for pk in category_ids],
+            [(day - window_start).days for day in days],
+        ] = totals
+
+    month_to_date = spend[:, (month_start - window_start).days :].sum(axis=1)
+    average_7 = spend[:, -7:].mean(axis=1)
+    average_28 = spend[:, -28:].mean(axis=1)
+
+    # least-squares line through each category's daily spend
+    t = np.arange(LOOKBACK_DAYS)
+    centered = t - t.mean()
+    slope = spend @ centered / (centered**2).sum()
+    intercept = spend.mean(axis=1) - slope * t.mean()
+
+    future = np.arange(LOOKBACK_DAYS, LOOKBACK_DAYS + HORIZON_DAYS)
+    projected = np.clip(intercept[:, None] + slope[:, None] * future, 0, None)
+    days_left = (month_end - today).days
+    month_total = month_to_date + projected[:, :days_left].sum(axis=1)
+
+    # spend counted against each limit so far, and how many days ahead it
+    # keeps accumulating before the window resets
+    spent = np.array([category.total_spent for category in categories], dtype=float)
+    horizon = np.full(len(categories), HORIZON_DAYS)
+    window_offset = np.zeros(len(categories), dtype=int)
+    periodic = np.zeros(len(categories), dtype=bool)
+    older_windows = []
+    for index, category in enumerate(categories):
+        window = limit_window(category, today) if category.limit else None
+        if window is None:
+            continue
+        periodic[index] = True
+        horizon[index] = (window[1] - today).days
+        window_offset[index] = (window[0] - window_start).days
+        if window_offset[index] < 0:
+            # custom windows longer than the lookback
+            older_windows.append(category)
+    in_window = t[None, :] >= window_offset[:, None]
+    spent[periodic] = (spend * in_window).sum(axis=1)[periodic]
+    for category_id, total in window_spent(older_windows).items():
+        spent[position[category_id]] = total
+
+    limits = np.array([category.limit for category in categories], dtype=float)
+    crossed = spent[:, None] + np.cumsum(projected, axis=1) >= limits[:, None]
+    crossed &= np.arange(HORIZON_DAYS)[None, :] < horizon[:, None]
+    crossing_day = np.where(crossed.any(axis=1), crossed.argmax(axis=1), -1)
+
+    averages_7, averages_28 = cents(average_7), cents(average_28)
+    trends, month_totals = cents(slope), cents(month_total)
+    forecast = []
+    for index, category in enumerate(categories):
+        limit = category.limit
+        limit_date = None
+        if not limit:
+            state = "no_limit"
+        elif spent[index] >= limit:
+            state = "over_limit"
+        else:
+            if crossing_day[index] >= 0:
+                limit_date = today + timedelta(days=int(crossing_day[index]) + 1)
+            state = "at_risk" if limit_date and limit_date <= month_end else "on_track"
+        forecast.append(
+            {
+                "category": {"id": category.public_id, "name": category.name},
+                "limit": from_cents(limit) if limit else None,
+                "limit_period": category.limit_period,
+                "spent": from_cents(int(spent[index])),
+                "month_to_date": from_cents(int(month_to_date[index])),
+                "average_7_days": averages_7[index],
+                "average_28_days": averages_28[index],
+                "trend_per_day": trends[index],
+                "projected_month_total": month_totals[index],
+                "limit_date": limit_date,
+                "status": state,
+            }
+        )
+    return forecast
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.accounts.models import User
+from apps.expenses.models import Expense
+from apps.user_stats.models import DailySpend
+from apps.user_stats.rollup import create_daily_spend
+from apps.user_stats.signals import invalidate_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily spend rollup from the raw expenses, one user at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild the rollup of the user with this email")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(email=options["user"])
+
+        rebuilt = 0
+        for owner_id in users.values_list("pk", flat=True).iterator():
+            rebuilt += self.rebuild(owner_id, options["batch_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} daily spend rows"))
+
+    def rebuild(self, owner_id, batch_size):
+        with transaction.atomic():
+            DailySpend.objects.filter(owner_id=owner_id).delete()
+            created = create_daily_spend(
+                DailySpend, Expense.objects.filter(owner_id=owner_id), batch_size
+            )
+            invalidate_stats(owner_id)
+        return created
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from apps.accounts.models import User
+from apps.expenses.models import Expense
+from apps.user_stats.models import UserTotal
+from apps.user_stats.signals import invalidate_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the lifetime expense totals of users and fix the ones that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only reconcile the user with this email")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["user"]:
+            users = users.filter(email=options["user"])
+
+        checked = fixed = 0
+        batch = []
+        for owner_id in users.values_list("pk", flat=True).iterator():
+            batch.append(owner_id)
+            if len(batch) == options["batch_size"]:
+                fixed += self.reconcile(batch)
+                checked += len(batch)
+                batch = []
+        if batch:
+            fixed += self.reconcile(batch)
+            checked += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} users, fixed {fixed} totals"))
+
+    def reconcile(self, owner_ids):
+        with transaction.atomic():
+            # the locks make concurrent expense writes of these users wait, so
+            # their increments land on top of the recomputed totals
+            stored = {
+                row.owner_id: row
+                for row in UserTotal.objects.select_for_update().filter(owner_id__in=owner_ids)
+            }
+            actual = {
+                row["owner_id"]: (row["total"], row["count"])
+                for row in Expense.objects.filter(owner_id__in=owner_ids)
+                .order_by()
+                .values("owner_id")
+                .annotate(total=Sum("amount"), count=Count("id"))
+            }
+
+            drifted = []
+            missing = []
+            for owner_id in owner_ids:
+                total, count = actual.get(owner_id, (0, 0))
+                row = stored.get(owner_id)
+                if row is None:
+                    if count:
+                        missing.append(UserTotal(owner_id=owner_id, total=total, count=count))
+                elif (row.total, row.count) != (total, count):
+                    row.total, row.count = total, count
+                    drifted.append(row)
+
+            UserTotal.objects.bulk_update(drifted, ["total", "count"])
+            UserTotal.objects.bulk_create(missing)
+            for row in drifted + missing:
+                invalidate_stats(row.owner_id)
+        return len(drifted) + len(missing)
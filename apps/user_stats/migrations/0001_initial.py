@@ -0,0 +1,46 @@
+# Generated by Django 4.2 on 2026-10-18 19:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from apps.user_stats.rollup import create_daily_spend
+
+
+def backfill_daily_spend(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    DailySpend = apps.get_model("user_stats", "DailySpend")
+    create_daily_spend(DailySpend, Expense.objects.all())
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('expenses', '0009_alter_expense_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to='expenses.category')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='dailyspend',
+            index=models.Index(fields=['owner', 'day'], name='daily_spend_owner_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyspend',
+            constraint=models.UniqueConstraint(fields=('owner', 'category', 'day'), name='unique_daily_spend_bucket'),
+        ),
+        migrations.RunPython(backfill_daily_spend, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2 on 2026-10-18 19:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def to_cents(apps, schema_editor):
+    DailySpend = apps.get_model("user_stats", "DailySpend")
+    DailySpend.objects.update(total=F("total") * 100)
+
+
+def from_cents(apps, schema_editor):
+    DailySpend = apps.get_model("user_stats", "DailySpend")
+    DailySpend.objects.update(total=F("total") / 100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_stats', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_cents, from_cents),
+        migrations.AlterField(
+            model_name='dailyspend',
+            name='total',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2 on 2026-10-18 19:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def backfill_user_totals(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    UserTotal = apps.get_model("user_stats", "UserTotal")
+    rows = (
+        Expense.objects.order_by()
+        .values("owner_id")
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+    UserTotal.objects.bulk_create(
+        (UserTotal(owner_id=row["owner_id"], total=row["total"], count=row["count"]) for row in rows),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0021_user_id_uuid7'),
+        ('expenses', '0015_amounts_in_cents'),
+        ('user_stats', '0002_total_in_cents'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserTotal',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='expense_totals', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total', models.BigIntegerField(default=0)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_user_totals, migrations.RunPython.noop),
+    ]
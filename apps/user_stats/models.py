@@ -1,3 +1,48 @@
 from django.db import models
 
-# Create your models here.
+from apps.accounts.models import User
+from apps.expenses.models import Category
+
+
+class DailySpend(models.Model):
+    """
+    Rollup of a user's expenses per category and day. It is kept up to date
+    from the `expenses_changed` signal so stats never have to rescan the raw
+    expense history; `manage.py rebuild_daily_spend` recomputes it.
+    """
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_spend")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="daily_spend")
+    day = models.DateField()
+    # in cents
+    total = models.BigIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "category", "day"], name="unique_daily_spend_bucket"
+            )
+        ]
+        indexes = [models.Index(fields=["owner", "day"], name="daily_spend_owner_day")]
+
+    def __str__(self):
+        return f"{self.category} {self.day}: {self.total}"
+
+
+class UserTotal(models.Model):
+    """
+    Lifetime total and count of a user's expenses, kept up to date from the
+    `expenses_changed` signal so reading it is a single row lookup;
+    `manage.py reconcile_user_totals` fixes any drift.
+    """
+
+    owner = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="expense_totals"
+    )
+    # in cents
+    total = models.BigIntegerField(default=0)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner}: {self.total}"
@@ -0,0 +1,31 @@
+from django.db.models import Count, Sum
+
+
+def create_daily_spend(DailySpend, expenses, batch_size=1000):
+    """
+    Insert the DailySpend rows of an expense queryset: one grouped query per
+    (owner, category, day) and bulk inserts of `batch_size` rows. The model
+    is passed in so migrations can use their historical version.
+    """
+    buckets = (
+        expenses.order_by()
+        .values("owner_id", "category_id", "created_at")
+        .annotate(total=Sum("amount"), count=Count("id"))
+    )
+    rows = []
+    created = 0
+    for bucket in buckets.iterator(chunk_size=batch_size):
+        rows.append(
+            DailySpend(
+                owner_id=bucket["owner_id"],
+                category_id=bucket["category_id"],
+                day=bucket["created_at"],
+                total=bucket["total"],
+                count=bucket["count"],
+            )
+        )
+        if len(rows) == batch_size:
+            created += len(DailySpend.objects.bulk_create(rows))
+            rows = []
+    created += len(DailySpend.objects.bulk_create(rows))
+    return created
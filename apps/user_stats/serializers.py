@@ -0,0 +1,48 @@
+from datetime import date
+
+from rest_framework import serializers
+from rest_framework.serializers import ValidationError
+
+from .comparison import PERIODS
+from .series import BUCKETS, MAX_BUCKETS, bucket_count
+
+
+class SpendSeriesSerializer(serializers.Serializer):
+    """Validates the query parameters of the spend time series"""
+
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    bucket = serializers.ChoiceField(choices=BUCKETS, default="day")
+    group_by = serializers.ChoiceField(choices=["category"], required=False)
+
+    def validate(self, attrs):
+        if attrs["start_date"] > attrs["end_date"]:
+            raise ValidationError({"end_date": "end_date must not be before start_date"})
+        if bucket_count(attrs["start_date"], attrs["end_date"], attrs["bucket"]) > MAX_BUCKETS:
+            raise ValidationError(
+                {"bucket": f"The range spans more than {MAX_BUCKETS} buckets, use a larger bucket"}
+            )
+        return attrs
+
+
+class PeriodComparisonSerializer(serializers.Serializer):
+    """Validates the query parameters of the period-over-period comparison"""
+
+    period = serializers.ChoiceField(choices=PERIODS, default="month")
+    full = serializers.BooleanField(default=False)
+
+
+class SpendAnalyticsSerializer(serializers.Serializer):
+    """Validates the query parameters of the spend analytics, by default the current month"""
+
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+
+    def validate(self, attrs):
+        today = date.today()
+        attrs.setdefault("start_date", today.replace(day=1))
+        attrs.setdefault("end_date", today)
+        if attrs["start_date"] > attrs["end_date"]:
+            raise ValidationError({"end_date": "end_date must not be before start_date"})
+        return attrs
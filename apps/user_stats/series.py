@@ -0,0 +1,98 @@
+"""
+Spend over time, summed per day/week/month/year bucket.
+
+The buckets are computed in the database by truncating the days of the
+DailySpend rollup and grouping on them, so one query covers any range and
+its cost depends on the number of days with expenses, not on the number of
+expenses. Buckets without expenses are filled in with zeros afterwards.
+"""
+from datetime import timedelta
+
+from django.db.models import DateField, Sum
+from django.db.models.functions import Trunc
+
+from apps.expenses.money import from_cents
+from .models import DailySpend
+
+BUCKETS = ["day", "week", "month", "year"]
+# about ten years of daily buckets
+MAX_BUCKETS = 3660
+
+
+def truncate(day, bucket):
+    """Start of the bucket holding `day`, the same way the database truncates it"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    if bucket == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_bucket(start, bucket):
+    if bucket == "day":
+        return start + timedelta(days=1)
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start + timedelta(days=32)).replace(day=1)
+    return start.replace(year=start.year + 1)
+
+
+def bucket_count(start_date, end_date, bucket):
+    if bucket == "day":
+        return (end_date - start_date).days + 1
+    if bucket == "week":
+        return (truncate(end_date, bucket) - truncate(start_date, bucket)).days // 7 + 1
+    if bucket == "month":
+        return (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+    return end_date.year - start_date.year + 1
+
+
+def bucket_starts(start_date, end_date, bucket):
+    starts = []
+    current = truncate(start_date, bucket)
+    while current <= end_date:
+        starts.append(current)
+        try:
+            current = next_bucket(current, bucket)
+        except (ValueError, OverflowError):
+            # the last representable bucket
+            break
+    return starts
+
+
+def point(period, total=0, count=0):
+    return {"period": period, "total": from_cents(total), "count": count}
+
+
+def spend_series(user, start_date, end_date, bucket="day", group_by=None):
+    buckets = bucket_starts(start_date, end_date, bucket)
+    rows = (
+        DailySpend.objects.filter(owner=user, day__gte=start_date, day__lte=end_date)
+        .annotate(period=Trunc("day", bucket, output_field=DateField()))
+        .order_by()
+    )
+    if group_by == "category":
+        rows = rows.values("period", "category__public_id", "category__name")
+    else:
+        rows = rows.values("period")
+    rows = rows.annotate(total=Sum("total"), count=Sum("count"))
+
+    if group_by != "category":
+        filled = {period: point(period) for period in buckets}
+        for row in rows:
+            filled[row["period"]] = point(row["period"], row["total"], row["count"])
+        return list(filled.values())
+
+    categories = {}
+    for row in rows:
+        key = (row["category__public_id"], row["category__name"])
+        if key not in categories:
+            categories[key] = {period: point(period) for period in buckets}
+        categories[key][row["period"]] = point(row["period"], row["total"], row["count"])
+    return [
+        {"category": {"id": public_id, "name": name}, "points": list(points.values())}
+        for (public_id, name), points in sorted(categories.items(), key=lambda item: item[0][1])
+    ]
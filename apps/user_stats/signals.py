@@ -0,0 +1,130 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.expenses.models import Category
+from apps.expenses.signals import categories_created, expenses_changed
+from apps.common.cache import stats_cache
+from .models import DailySpend, UserTotal
+
+
+@receiver(expenses_changed)
+def update_daily_spend(sender, deltas, **kwargs):
+    if len(deltas) == 1:
+        apply_delta(deltas[0])
+        return
+    try:
+        with transaction.atomic():
+            apply_deltas_in_bulk(deltas)
+    except IntegrityError:
+        # a bucket was created by a concurrent request, go one bucket at a time
+        for delta in deltas:
+            apply_delta(delta)
+
+
+def apply_delta(delta):
+    bucket = DailySpend.objects.filter(
+        owner_id=delta.owner_id, category_id=delta.category_id, day=delta.day
+    )
+    updated = bucket.update(
+        total=F("total") + delta.amount, count=F("count") + delta.count
+    )
+    if not updated and delta.count > 0:
+        try:
+            with transaction.atomic():
+                DailySpend.objects.create(
+                    owner_id=delta.owner_id,
+                    category_id=delta.category_id,
+                    day=delta.day,
+                    total=delta.amount,
+                    count=delta.count,
+                )
+        except IntegrityError:
+            # another request created the bucket in the meantime
+            bucket.update(
+                total=F("total") + delta.amount, count=F("count") + delta.count
+            )
+    elif delta.count < 0:
+        bucket.filter(count__lte=0).delete()
+
+
+def apply_deltas_in_bulk(deltas):
+    """
+    Apply many deltas (bulk inserts, imports) with a fixed number of queries:
+    lock the existing buckets and update them in place, insert the new ones
+    and delete the buckets left without expenses.
+    """
+    deltas = {(d.owner_id, d.category_id, d.day): d for d in deltas}
+    existing = DailySpend.objects.select_for_update().filter(
+        owner_id__in={key[0] for key in deltas},
+        category_id__in={key[1] for key in deltas},
+        day__in={key[2] for key in deltas},
+    )
+    updated = []
+    emptied = []
+    for row in existing:
+        delta = deltas.pop((row.owner_id, row.category_id, row.day), None)
+        if delta is None:
+            continue
+        row.total += delta.amount
+        row.count += delta.count
+        (updated if row.count > 0 else emptied).append(row)
+    created = [
+        DailySpend(owner_id=owner_id, category_id=category_id, day=day, total=d.amount, count=d.count)
+        for (owner_id, category_id, day), d in deltas.items()
+        if d.count > 0
+    ]
+
+    DailySpend.objects.bulk_update(updated, ["total", "count"], batch_size=1000)
+    DailySpend.objects.filter(pk__in=[row.pk for row in emptied]).delete()
+    DailySpend.objects.bulk_create(created, batch_size=1000)
+
+
+@receiver(expenses_changed)
+def update_user_totals(sender, deltas, **kwargs):
+    totals = defaultdict(lambda: [0, 0])
+    for delta in deltas:
+        totals[delta.owner_id][0] += delta.amount
+        totals[delta.owner_id][1] += delta.count
+    for owner_id, (amount, count) in totals.items():
+        if not (amount or count):
+            continue
+        row = UserTotal.objects.filter(owner_id=owner_id)
+        updated = row.update(total=F("total") + amount, count=F("count") + count)
+        # removals without a row happen while the user is deleted (the
+        # cascade can drop the row before the expenses)
+        if not updated and count > 0:
+            try:
+                with transaction.atomic():
+                    UserTotal.objects.create(owner_id=owner_id, total=amount, count=count)
+            except IntegrityError:
+                # another request created the row in the meantime
+                row.update(total=F("total") + amount, count=F("count") + count)
+
+
+def invalidate_stats(owner_id):
+    stats_cache.bump(owner_id)
+    # again once the write is visible to other requests, in case one of them
+    # cached what it read before the commit under the new version
+    transaction.on_commit(lambda: stats_cache.bump(owner_id))
+
+
+@receiver(expenses_changed)
+def invalidate_stats_on_expense_change(sender, deltas, **kwargs):
+    for owner_id in {delta.owner_id for delta in deltas}:
+        invalidate_stats(owner_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_stats_on_category_change(sender, instance, **kwargs):
+    if instance.owner_id is not None:
+        invalidate_stats(instance.owner_id)
+
+
+@receiver(categories_created)
+def invalidate_stats_on_categories_created(sender, owner_id, **kwargs):
+    invalidate_stats(owner_id)
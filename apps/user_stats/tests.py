@@ -1,3 +1,804 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from rest_framework.test import APIClient
+
+from apps.accounts.models import User
+from apps.common.cache import DjangoCacheBackend, LocalBackend, StatsCache, stats_cache
+from apps.expenses.models import Category, Expense
+from apps.expenses.signals import send_deltas
+from apps.user_stats.analytics import SimpleSpendAnalytics, spend_analytics
+from apps.user_stats.comparison import compare_periods, comparison_windows
+from apps.user_stats.forecast import LOOKBACK_DAYS, budget_forecast
+from apps.user_stats.models import DailySpend, UserTotal
+from apps.user_stats.views import ExpensesStats
+
+
+class ExpensesStatsTests(TestCase):
+    url = "/api/v1/expense-stats/"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="stats@mail.com", password="testuser"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_category(self, name, amounts=()):
+        category = Category.objects.create(name=name, owner=self.user)
+        for amount in amounts:
+            Expense.objects.create(
+                category=category, amount=amount, description=name, owner=self.user
+            )
+        return category
+
+    def test_totals_per_category_with_empty_categories(self):
+        self.add_category("Food", [1050, 450])
+        self.add_category("Rent", [10000])
+        self.add_category("Travel")
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["Category Data"],
+            {"Food": Decimal("15.00"), "Rent": Decimal("100.00"), "Travel": Decimal("0")},
+        )
+
+    def test_range_filters_expenses(self):
+        food = self.add_category("Food", [1000, 500])
+        expense = Expense.objects.get(category=food, amount=500)
+        expense.created_at = date.today() - timedelta(days=1)
+        expense.save()
+
+        today = self.client.get(self.url, {"range": "Today"})
+        yesterday = self.client.get(self.url, {"range": "Yesterday"})
+
+        self.assertEqual(today.data["Category Data"], {"Food": Decimal("10.00")})
+        self.assertEqual(yesterday.data["Category Data"], {"Food": Decimal("5.00")})
+
+    def test_query_count_does_not_grow_with_categories(self):
+        self.add_category("Food", [100])
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url, {"range": "This month"})
+
+        for i in range(10):
+            self.add_category(f"Category {i}", [200, 300])
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(self.url, {"range": "This month"})
+
+        self.assertEqual(len(few), len(many))
+
+    def test_invalid_range(self):
+        response = self.client.get(self.url, {"range": "Last decade"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_several_ranges_in_one_query(self):
+        food = self.add_category("Food", [1000, 500])
+        self.add_category("Rent")
+        expense = Expense.objects.get(category=food, amount=500)
+        expense.created_at = date.today() - timedelta(days=1)
+        expense.save()
+        yesterday = expense.created_at.isoformat()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                self.url, {"ranges": f"Today,yesterday,{yesterday}..{date.today().isoformat()}"}
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["Category Data"],
+            {
+                "Today": {"Food": Decimal("10.00"), "Rent": Decimal("0.00")},
+                "yesterday": {"Food": Decimal("5.00"), "Rent": Decimal("0.00")},
+                f"{yesterday}..{date.today().isoformat()}": {
+                    "Food": Decimal("15.00"),
+                    "Rent": Decimal("0.00"),
+                },
+            },
+        )
+
+    def test_invalid_ranges(self):
+        for ranges in [
+            "today,last decade",
+            "2024-02-01..2024-01-01",
+            "2024-01-01",
+            "2024-13-01..2024-12-01",
+            ",",
+            " , ",
+        ]:
+            response = self.client.get(self.url, {"ranges": ranges})
+            self.assertEqual(response.status_code, 400, ranges)
+
+
+class DailySpendTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="rollup@mail.com", password="testuser"
+        )
+        self.food = Category.objects.create(name="Food", owner=self.user)
+        self.rent = Category.objects.create(name="Rent", owner=self.user)
+
+    def rollup(self):
+        return {
+            (row.category_id, row.day): (row.total, row.count)
+            for row in DailySpend.objects.filter(owner=self.user)
+        }
+
+    def add_expense(self, category, amount):
+        return Expense.objects.create(
+            category=category, amount=amount, description="test", owner=self.user
+        )
+
+    def test_create_update_and_delete_keep_rollup_in_sync(self):
+        today = date.today()
+        first = self.add_expense(self.food, 1000)
+        self.add_expense(self.food, 250)
+        self.assertEqual(self.rollup(), {(self.food.pk, today): (1250, 2)})
+
+        first = Expense.objects.get(pk=first.pk)
+        first.amount = 400
+        first.category = self.rent
+        first.save()
+        self.assertEqual(
+            self.rollup(),
+            {
+                (self.food.pk, today): (250, 1),
+                (self.rent.pk, today): (400, 1),
+            },
+        )
+
+        first.delete()
+        self.assertEqual(self.rollup(), {(self.food.pk, today): (250, 1)})
+
+    def test_saves_without_a_loaded_row_replace_the_stored_one(self):
+        expense = self.add_expense(self.food, 100)
+        Expense(
+            pk=expense.pk,
+            public_id=expense.public_id,
+            category=self.food,
+            owner=self.user,
+            amount=300,
+            description="rebuilt",
+            created_at=expense.created_at,
+        ).save()
+        partial = Expense.objects.only("description").get(pk=expense.pk)
+        partial.description = "renamed"
+        partial.save()
+
+        self.food.refresh_from_db()
+        self.assertEqual(self.food.total_spent, 300)
+        self.assertEqual(self.rollup(), {(self.food.pk, date.today()): (300, 1)})
+        self.assertEqual(
+            UserTotal.objects.values_list("total", "count").get(owner=self.user), (300, 1)
+        )
+
+    def test_rebuild_command_matches_incremental_rollup(self):
+        self.add_expense(self.food, 1000)
+        self.add_expense(self.rent, 30000)
+        expected = self.rollup()
+
+        DailySpend.objects.all().delete()
+        version = stats_cache.get_version(self.user.pk)
+        call_command("rebuild_daily_spend", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(self.rollup(), expected)
+        # stats cached from the old rollup are dropped
+        self.assertNotEqual(stats_cache.get_version(self.user.pk), version)
+
+    def test_bulk_deltas_match_rebuild(self):
+        self.add_expense(self.food, 100)
+        expenses = [
+            Expense(
+                category=category,
+                amount=amount,
+                description="bulk",
+                owner=self.user,
+                created_at=date.today() - timedelta(days=day),
+            )
+            for category in [self.food, self.rent]
+            for day, amount in [(0, 200), (0, 300), (1, 400)]
+        ]
+        Expense.objects.bulk_create(expenses)
+        send_deltas([expense.as_delta() for expense in expenses])
+        incremental = self.rollup()
+
+        call_command("rebuild_daily_spend", stdout=StringIO())
+
+        self.assertEqual(incremental, self.rollup())
+        self.assertEqual(incremental[(self.food.pk, date.today())], (600, 3))
+
+    def test_bulk_deltas_update_buckets_in_place(self):
+        kept = self.add_expense(self.food, 100)
+        removed = self.add_expense(self.rent, 200)
+        buckets = dict(DailySpend.objects.values_list("category_id", "pk"))
+        added = Expense(category=self.food, amount=300, description="bulk", owner=self.user)
+        Expense.objects.bulk_create([added])
+
+        send_deltas([added.as_delta(), removed.as_delta()._replace(amount=-200, count=-1)])
+
+        # the locked row is updated, not replaced, so a concurrent single
+        # delta waiting on it still applies to the live bucket
+        self.assertEqual(DailySpend.objects.get(category=self.food).pk, buckets[self.food.pk])
+        self.assertEqual(self.rollup(), {(self.food.pk, kept.created_at): (400, 2)})
+
+
+class TotalExpensesTests(TestCase):
+    url = "/api/v1/total-expenses/"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="total@mail.com", password="testuser"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user)
+
+    def add_expense(self, amount):
+        return Expense.objects.create(
+            category=self.food, amount=amount, description="test", owner=self.user
+        )
+
+    def test_total_is_a_single_row_read(self):
+        self.assertEqual(self.client.get(self.url).data, {"total expenses": Decimal("0.00"), "count": 0})
+
+        first = self.add_expense(1000)
+        self.add_expense(250)
+        first.amount = 400
+        first.save()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data, {"total expenses": Decimal("6.50"), "count": 2})
+
+        first.delete()
+        self.assertEqual(self.client.get(self.url).data["count"], 1)
+
+    def test_bulk_deltas_update_the_total(self):
+        expenses = [
+            Expense(category=self.food, amount=amount, description="bulk", owner=self.user)
+            for amount in [100, 200, 300]
+        ]
+        Expense.objects.bulk_create(expenses)
+        send_deltas([expense.as_delta() for expense in expenses])
+
+        self.assertEqual(
+            UserTotal.objects.values_list("total", "count").get(owner=self.user), (600, 3)
+        )
+
+    def test_deleting_the_user_leaves_no_total_behind(self):
+        self.add_expense(1000)
+        self.add_expense(250)
+
+        self.user.delete()
+        connection.check_constraints()
+        self.assertFalse(UserTotal.objects.exists())
+
+    def test_deleting_a_user_does_not_touch_expenses_one_by_one(self):
+        def delete_user(email, expenses):
+            user = User.objects.create_user(
+                first_name="test", last_name="user", email=email, password="testuser"
+            )
+            category = Category.objects.create(name="Food", owner=user)
+            for _ in range(expenses):
+                Expense.objects.create(category=category, amount=100, description="test", owner=user)
+            with CaptureQueriesContext(connection) as queries:
+                user.delete()
+            return len(queries)
+
+        self.assertEqual(delete_user("one@mail.com", 1), delete_user("many@mail.com", 50))
+        self.assertFalse(Expense.objects.exclude(owner=self.user).exists())
+
+    def test_deleting_a_category_removes_its_expenses_from_the_total(self):
+        self.add_expense(1000)
+        travel = Category.objects.create(name="Travel", owner=self.user)
+        for amount in [200, 300]:
+            Expense.objects.create(category=travel, amount=amount, description="bus", owner=self.user)
+
+        travel.delete()
+
+        self.assertEqual(
+            UserTotal.objects.values_list("total", "count").get(owner=self.user), (1000, 1)
+        )
+        self.assertEqual(
+            list(DailySpend.objects.values_list("category_id", "total")), [(self.food.pk, 1000)]
+        )
+
+    def test_reconcile_fixes_drift(self):
+        self.add_expense(1000)
+        other = User.objects.create_user(
+            first_name="test", last_name="user", email="other@mail.com", password="testuser"
+        )
+        UserTotal.objects.filter(owner=self.user).update(total=1, count=5)
+        UserTotal.objects.create(owner=other, total=500, count=1)
+        Expense.objects.bulk_create(
+            [Expense(category=self.food, amount=300, description="untracked", owner=self.user)]
+        )
+
+        self.assertEqual(self.client.get(self.url).data["total expenses"], Decimal("0.01"))
+        out = StringIO()
+        call_command("reconcile_user_totals", batch_size=1, stdout=out)
+
+        self.assertIn("fixed 2 totals", out.getvalue())
+        self.assertEqual(self.client.get(self.url).data["total expenses"], Decimal("13.00"))
+        self.assertEqual(
+            dict(UserTotal.objects.values_list("owner_id", "total")), {self.user.pk: 1300, other.pk: 0}
+        )
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+
+class SpendSeriesTests(TestCase):
+    url = "/api/v1/expense-stats/series/"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="series@mail.com", password="testuser"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user)
+        self.rent = Category.objects.create(name="Rent", owner=self.user)
+        for category, amount, day in [
+            (self.food, 1000, date(2023, 1, 2)),
+            (self.food, 500, date(2023, 1, 3)),
+            (self.rent, 80000, date(2023, 1, 31)),
+            (self.food, 250, date(2023, 3, 15)),
+        ]:
+            Expense.objects.create(
+                category=category, amount=amount, description="test", owner=self.user, created_at=day
+            )
+
+    def get(self, **params):
+        return self.client.get(self.url, params)
+
+    def points(self, series):
+        return [(point["period"], point["total"], point["count"]) for point in series]
+
+    def test_monthly_buckets_are_zero_filled(self):
+        with self.assertNumQueries(1):
+            response = self.get(start_date="2023-01-01", end_date="2023-04-30", bucket="month")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.points(response.data["series"]),
+            [
+                (date(2023, 1, 1), Decimal("815.00"), 3),
+                (date(2023, 2, 1), Decimal("0.00"), 0),
+                (date(2023, 3, 1), Decimal("2.50"), 1),
+                (date(2023, 4, 1), Decimal("0.00"), 0),
+            ],
+        )
+
+    def test_weekly_buckets_start_on_monday(self):
+        response = self.get(start_date="2023-01-01", end_date="2023-01-10", bucket="week")
+
+        self.assertEqual(
+            self.points(response.data["series"]),
+            [
+                (date(2022, 12, 26), Decimal("0.00"), 0),
+                (date(2023, 1, 2), Decimal("15.00"), 2),
+                (date(2023, 1, 9), Decimal("0.00"), 0),
+            ],
+        )
+
+    def test_grouped_by_category(self):
+        with self.assertNumQueries(1):
+            response = self.get(
+                start_date="2023-01-01", end_date="2023-12-31", bucket="year", group_by="category"
+            )
+
+        series = response.data["series"]
+        self.assertEqual(
+            [(s["category"]["name"], self.points(s["points"])) for s in series],
+            [
+                ("Food", [(date(2023, 1, 1), Decimal("17.50"), 3)]),
+                ("Rent", [(date(2023, 1, 1), Decimal("800.00"), 1)]),
+            ],
+        )
+        self.assertEqual(series[0]["category"]["id"], self.food.public_id)
+
+    def test_daily_buckets_over_a_range(self):
+        response = self.get(start_date="2023-01-02", end_date="2023-01-04")
+        self.assertEqual(
+            [point["total"] for point in response.data["series"]],
+            [Decimal("10.00"), Decimal("5.00"), Decimal("0.00")],
+        )
+
+    def test_invalid_parameters(self):
+        for params in [
+            {"start_date": "2023-01-01"},
+            {"start_date": "2023-02-01", "end_date": "2023-01-01"},
+            {"start_date": "2023-01-01", "end_date": "2023-01-31", "bucket": "hour"},
+            {"start_date": "1900-01-01", "end_date": "2023-01-31", "bucket": "day"},
+        ]:
+            self.assertEqual(self.get(**params).status_code, 400, params)
+
+
+class PeriodComparisonTests(TestCase):
+    today = date(2024, 3, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="compare@mail.com", password="testuser"
+        )
+        self.food = Category.objects.create(name="Food", owner=self.user)
+        self.rent = Category.objects.create(name="Rent", owner=self.user)
+        Category.objects.create(name="Travel", owner=self.user)
+        for category, amount, day in [
+            (self.food, 1000, date(2024, 2, 5)),
+            (self.food, 3000, date(2024, 2, 20)),
+            (self.food, 1500, date(2024, 3, 2)),
+            (self.food, 500, date(2024, 3, 9)),
+            (self.rent, 80000, date(2024, 3, 1)),
+        ]:
+            Expense.objects.create(
+                category=category, amount=amount, description="test", owner=self.user, created_at=day
+            )
+
+    def categories(self, comparison):
+        return {row["category"]["name"]: row for row in comparison["categories"]}
+
+    def test_windows(self):
+        self.assertEqual(
+            comparison_windows("month", date(2024, 3, 31)),
+            ((date(2024, 3, 1), date(2024, 3, 31)), (date(2024, 2, 1), date(2024, 2, 29))),
+        )
+        self.assertEqual(
+            comparison_windows("week", date(2024, 3, 13)),
+            ((date(2024, 3, 11), date(2024, 3, 13)), (date(2024, 3, 4), date(2024, 3, 6))),
+        )
+        self.assertEqual(
+            comparison_windows("year", date(2024, 3, 10), full=True)[1],
+            (date(2023, 1, 1), date(2023, 12, 31)),
+        )
+
+    def test_month_to_date_against_the_same_days_of_last_month(self):
+        with self.assertNumQueries(1):
+            comparison = compare_periods(self.user, "month", self.today)
+
+        self.assertEqual(comparison["previous"], {"start": date(2024, 2, 1), "end": date(2024, 2, 10)})
+        food = self.categories(comparison)["Food"]
+        self.assertEqual((food["current"], food["previous"]), (Decimal("20.00"), Decimal("10.00")))
+        self.assertEqual((food["change"], food["change_percent"]), (Decimal("10.00"), Decimal("100.0")))
+        self.assertEqual((food["current_count"], food["previous_count"]), (2, 1))
+        self.assertIsNone(self.categories(comparison)["Rent"]["change_percent"])
+        self.assertEqual(self.categories(comparison)["Travel"]["current"], Decimal("0.00"))
+        self.assertEqual(comparison["total"]["current"], Decimal("820.00"))
+
+    def test_full_previous_period(self):
+        food = self.categories(compare_periods(self.user, "month", self.today, full=True))["Food"]
+        self.assertEqual((food["previous"], food["change_percent"]), (Decimal("40.00"), Decimal("-50.0")))
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get("/api/v1/expense-stats/compare/", {"period": "year"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["period"], "year")
+        self.assertEqual(client.get("/api/v1/expense-stats/compare/", {"period": "day"}).status_code, 400)
+
+        response = client.get("/api/v1/expense-stats/", {"range": "last month"})
+        self.assertEqual(response.status_code, 200)
+
+
+class SpendAnalyticsTests(TestCase):
+    start, end = date(2024, 3, 1), date(2024, 3, 31)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="analytics@mail.com", password="testuser"
+        )
+        food = Category.objects.create(name="Food", owner=self.user)
+        rent = Category.objects.create(name="Rent", owner=self.user)
+        Category.objects.create(name="Travel", owner=self.user)
+        for category, amount, day in [
+            (food, 100, date(2024, 3, 1)),
+            (food, 200, date(2024, 3, 2)),
+            (food, 300, date(2024, 3, 2)),
+            (food, 400, date(2024, 3, 20)),
+            (food, 1000, date(2024, 3, 31)),
+            (rent, 8000, date(2024, 3, 1)),
+            (rent, 90000, date(2024, 2, 1)),
+        ]:
+            Expense.objects.create(
+                category=category, amount=amount, description="test", owner=self.user, created_at=day
+            )
+
+    def test_constant_number_of_queries(self):
+        with self.assertNumQueries(3):
+            analytics = spend_analytics(self.user, self.start, self.end, limit=2)
+
+        self.assertEqual(
+            [(row["amount"], row["category"]["name"]) for row in analytics["largest_expenses"]],
+            [("80.00", "Rent"), ("10.00", "Food")],
+        )
+        self.assertEqual(
+            [
+                (row["rank"], row["category"]["name"], row["total"], row["share"])
+                for row in analytics["top_categories"]
+            ],
+            [
+                (1, "Rent", Decimal("80.00"), Decimal("80.0")),
+                (2, "Food", Decimal("20.00"), Decimal("20.0")),
+            ],
+        )
+        self.assertEqual(
+            [
+                (row["category"]["name"], row["count"], row["median"], row["p90"])
+                for row in analytics["expense_sizes"]
+            ],
+            [
+                ("Food", 5, Decimal("3.00"), Decimal("7.60")),
+                ("Rent", 1, Decimal("80.00"), Decimal("80.00")),
+            ],
+        )
+
+    def test_database_percentiles_match_the_fallback(self):
+        fallback = SimpleSpendAnalytics().expense_sizes(self.user, self.start, self.end)
+        self.assertEqual(spend_analytics(self.user, self.start, self.end)["expense_sizes"], fallback)
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(
+            "/api/v1/expense-stats/analytics/",
+            {"start_date": "2024-02-01", "end_date": "2024-03-31", "limit": 1},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["largest_expenses"][0]["amount"], "900.00")
+        self.assertEqual(len(response.data["top_categories"]), 1)
+
+        response = client.get("/api/v1/expense-stats/analytics/", {"limit": 0})
+        self.assertEqual(response.status_code, 400)
+        response = client.get("/api/v1/expense-stats/analytics/")
+        self.assertEqual(response.data["end_date"], date.today())
+
+
+class BudgetForecastTests(TestCase):
+    today = date(2023, 3, 20)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="forecast@mail.com", password="testuser"
+        )
+        self.food = Category.objects.create(name="Food", owner=self.user, limit=100000)
+        self.rent = Category.objects.create(name="Rent", owner=self.user)
+        self.travel = Category.objects.create(name="Travel", owner=self.user, limit=5000)
+        for offset in range(LOOKBACK_DAYS):
+            self.add(self.food, 1000, self.today - timedelta(days=offset))
+        self.add(self.rent, 80000, date(2023, 3, 1))
+
+    def add(self, category, amount, day):
+        Expense.objects.create(
+            category=category, amount=amount, description="test", owner=self.user, created_at=day
+        )
+
+    def forecast(self):
+        return {row["category"]["name"]: row for row in budget_forecast(self.user, self.today)}
+
+    def test_projects_every_category_in_two_queries(self):
+        with self.assertNumQueries(2):
+            forecast = self.forecast()
+
+        food = forecast["Food"]
+        self.assertEqual(food["month_to_date"], Decimal("200.00"))
+        self.assertEqual(food["average_7_days"], Decimal("10.00"))
+        self.assertEqual(food["trend_per_day"], Decimal("0.00"))
+        # 11 more days at 10.00
+        self.assertEqual(food["projected_month_total"], Decimal("310.00"))
+        # 900.00 spent out of 1000.00
+        self.assertEqual(food["limit_date"], date(2023, 3, 30))
+        self.assertEqual(food["status"], "at_risk")
+
+        self.assertEqual(forecast["Rent"]["month_to_date"], Decimal("800.00"))
+        self.assertEqual(forecast["Rent"]["status"], "no_limit")
+        self.assertEqual(forecast["Travel"]["projected_month_total"], Decimal("0.00"))
+        self.assertIsNone(forecast["Travel"]["limit_date"])
+        self.assertEqual(forecast["Travel"]["status"], "on_track")
+
+    def test_growing_spend_has_a_positive_trend(self):
+        shopping = Category.objects.create(name="Shopping", owner=self.user, limit=10**7)
+        for offset in range(LOOKBACK_DAYS):
+            self.add(shopping, 100 * (LOOKBACK_DAYS - offset), self.today - timedelta(days=offset))
+
+        shopping = self.forecast()["Shopping"]
+        self.assertEqual(shopping["trend_per_day"], Decimal("1.00"))
+        # 91.00, 92.00, ... 101.00 over the rest of the month
+        self.assertEqual(
+            shopping["projected_month_total"],
+            shopping["month_to_date"] + sum(Decimal(n) for n in range(91, 102)),
+        )
+        self.assertEqual(shopping["status"], "on_track")
+
+    def test_periodic_limits_only_count_the_current_window(self):
+        self.food.limit_period = "month"
+        self.food.limit = 25000
+        self.food.save()
+        food = self.forecast()["Food"]
+        # 200.00 spent this month, 10.00 a day after that
+        self.assertEqual(food["spent"], Decimal("200.00"))
+        self.assertEqual(food["limit_date"], date(2023, 3, 25))
+        self.assertEqual(food["status"], "at_risk")
+
+        # the window resets before the limit is reached
+        self.food.limit = 40000
+        self.food.save()
+        food = self.forecast()["Food"]
+        self.assertIsNone(food["limit_date"])
+        self.assertEqual(food["status"], "on_track")
+
+    def test_over_limit(self):
+        self.travel.limit = 500
+        self.travel.save()
+        self.add(self.travel, 1000, self.today)
+        self.assertEqual(self.forecast()["Travel"]["status"], "over_limit")
+
+    def test_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get("/api/v1/expense-stats/forecast/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["date"], date.today())
+        self.assertEqual(
+            [row["category"]["name"] for row in response.data["categories"]],
+            ["Food", "Rent", "Travel"],
+        )
+
+
+class StatsCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="cache@mail.com", password="testuser"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = Category.objects.create(name="Food", owner=self.user)
+        Expense.objects.create(category=self.food, amount=1000, description="test", owner=self.user)
+
+    def test_repeated_stats_are_served_from_cache(self):
+        hits = stats_cache.hits
+        first = self.client.get("/api/v1/expense-stats/", {"range": "today"})
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/v1/expense-stats/", {"range": "Today"})
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(stats_cache.hits, hits + 1)
+
+    def test_single_and_multi_range_entries_are_separate(self):
+        several = self.client.get("/api/v1/expense-stats/", {"ranges": "This month"})
+        single = self.client.get("/api/v1/expense-stats/", {"range": "this month"})
+        self.assertEqual(set(several.data["Category Data"]), {"This month"})
+        self.assertEqual(single.data["Category Data"], {"Food": Decimal("10.00")})
+
+        again = self.client.get("/api/v1/expense-stats/", {"ranges": "this month"})
+        self.assertEqual(set(again.data["Category Data"]), {"this month"})
+
+    def test_writes_invalidate_the_cache(self):
+        url = "/api/v1/total-expenses/"
+        self.assertEqual(self.client.get(url).data["count"], 1)
+
+        Expense.objects.create(category=self.food, amount=500, description="test", owner=self.user)
+        self.assertEqual(self.client.get(url).data["count"], 2)
+
+        Category.objects.create(name="Rent", owner=self.user)
+        stats = self.client.get("/api/v1/expense-stats/").data["Category Data"]
+        self.assertEqual(set(stats), {"Food", "Rent"})
+
+        # moves no expense, but creates the category
+        self.client.patch(
+            "/api/v1/expenses/bulk/selection/",
+            {"filter": {"query": "nothing matches"}, "category": "Travel"},
+            format="json",
+        )
+        stats = self.client.get("/api/v1/expense-stats/").data["Category Data"]
+        self.assertEqual(set(stats), {"Food", "Rent", "Travel"})
+
+    def test_category_detail_aggregates_are_cached(self):
+        url = f"/api/v1/categories/{self.food.public_id}/"
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data["data"]["total"], Decimal("10.00"))
+
+        Expense.objects.create(category=self.food, amount=500, description="test", owner=self.user)
+        self.assertEqual(self.client.get(url).data["data"]["count"], 2)
+
+    def test_backends(self):
+        local = LocalBackend(max_entries=2, timeout=60)
+        for key in ["a", "b", "c"]:
+            local.set(key, key)
+        self.assertEqual([local.get(key) is not None for key in "bc"], [True, True])
+        self.assertIsNot(local.get("a"), "a")
+
+        cache = StatsCache(DjangoCacheBackend("default", timeout=60))
+        calls = []
+        for _ in range(2):
+            cache.get_or_compute(1, "key", lambda: calls.append(1) or len(calls))
+        cache.bump(1)
+        self.assertEqual(cache.get_or_compute(1, "key", lambda: "fresh"), "fresh")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.info()["hits"], cache.info()["misses"]), (1, 2))
+
+    def test_counters_are_staff_only(self):
+        url = "/api/v1/stats-cache/"
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(set(response.data), {"backend", "hits", "misses", "coalesced", "hit_rate"})
+
+
+class StatsLoadTests(TransactionTestCase):
+    url = "/api/v1/expense-stats/"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            first_name="test", last_name="user", email="load@mail.com", password="testuser"
+        )
+        food = Category.objects.create(name="Food", owner=self.user)
+        Expense.objects.create(category=food, amount=1000, description="test", owner=self.user)
+
+    def run_duplicates(self, count):
+        """Send `count` identical stats requests at once and count the queries they run"""
+        barrier = threading.Barrier(count)
+        lock = threading.Lock()
+        queries = []
+        responses = []
+
+        def count_query(execute, sql, params, many, context):
+            with lock:
+                queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                with connection.execute_wrapper(count_query):
+                    barrier.wait()
+                    response = client.get(self.url, {"range": "this month"})
+                with lock:
+                    responses.append(response.data)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(responses), count)
+        self.assertTrue(all(data == responses[0] for data in responses))
+        return len(queries)
+
+    def test_database_work_stays_flat_as_duplicates_go_up(self):
+        compute = ExpensesStats.get_category_totals
+
+        def slow_compute(*args, **kwargs):
+            # keep the computation in flight while the duplicates arrive
+            time.sleep(0.2)
+            return compute(*args, **kwargs)
+
+        queries = {}
+        with mock.patch.object(ExpensesStats, "get_category_totals", slow_compute):
+            for count in [1, 4, 16]:
+                stats_cache.bump(self.user.pk)
+                queries[count] = self.run_duplicates(count)
+
+        self.assertGreater(queries[1], 0)
+        self.assertEqual(queries[4], queries[1])
+        self.assertEqual(queries[16], queries[1])
@@ -1,7 +1,21 @@
 from django.urls import path 
 
-from .views import ExpensesStats
+from .views import (
+    BudgetForecast,
+    ExpensesStats,
+    PeriodComparison,
+    SpendAnalytics,
+    SpendSeries,
+    StatsCacheInfo,
+    TotalExpenses,
+)
 
 urlpatterns = [
     path('expense-stats/', ExpensesStats.as_view()),
+    path('expense-stats/series/', SpendSeries.as_view()),
+    path('expense-stats/forecast/', BudgetForecast.as_view()),
+    path('expense-stats/compare/', PeriodComparison.as_view()),
+    path('expense-stats/analytics/', SpendAnalytics.as_view()),
+    path('total-expenses/', TotalExpenses.as_view()),
+    path('stats-cache/', StatsCacheInfo.as_view()),
 ]
\ No newline at end of file
@@ -1,16 +1,35 @@
 from django.shortcuts import render
 from datetime import timedelta, date
 
+from django.db.models import BigIntegerField, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_date
+
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
-from apps.expenses.models import Expense, Category
-from apps.expenses.serializers import ExpenseSerializer
+from apps.common.cache import stats_cache
+from apps.expenses.models import Category
+from apps.expenses.money import from_cents
+from .analytics import spend_analytics
+from .comparison import PERIODS, compare_periods, comparison_windows
+from .forecast import LOOKBACK_DAYS, budget_forecast
+from .models import UserTotal
+from .serializers import (
+    PeriodComparisonSerializer,
+    SpendAnalyticsSerializer,
+    SpendSeriesSerializer,
+)
+from .series import BUCKETS, spend_series
 
 tags = ["Stats"]
 
+NAMED_RANGES = ["today", "yesterday", "this week", "this month", "last week", "last month"]
+MAX_RANGES = 10
+
 
 class ExpensesStats(APIView):
     """
@@ -38,7 +57,9 @@ class ExpensesStats(APIView):
                 }
             }
             ```
-    """,
+    """
+
+    permission_classes = [IsAuthenticated]
 
     @extend_schema(
         tags=tags,
@@ -53,39 +74,94 @@ class ExpensesStats(APIView):
                 type=str,
                 required=False,
                 description="Date range",
-                enum=["Today", "Yesterday", "This week", "This month"],
+                enum=["Today", "Yesterday", "This week", "This month", "Last week", "Last month"],
+            ),
+            OpenApiParameter(
+                name="ranges",
+                type=str,
+                required=False,
+                description=f"""
+                    Comma-separated list of up to {MAX_RANGES} ranges to compute at once, each
+                    one of the `range` values or a custom `YYYY-MM-DD..YYYY-MM-DD` range. The
+                    totals are then returned per range
+                    """,
             ),
-            
         ],
     )
     def get(self, request):
+        if request.query_params.get("ranges"):
+            return self.get_many(request)
+
         date_range = request.query_params.get("range")
         
         if date_range:
-            if date_range.lower() not in [
-                "today",
-                "yesterday",
-                "this week",
-                "this month",
-            ]:
+            if date_range.lower() not in NAMED_RANGES:
                 return Response(
                     {
-                        "error": "Invalid range. Use 'today', 'yesterday', 'this week' or 'this month' "
+                        "error": "Invalid range. Use 'today', 'yesterday', 'this week', 'this month', "
+                        "'last week' or 'last month'"
                     },
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-        categories = Category.objects.filter(owner=request.user)
-        total = {}
-        for category in categories:
-            expenses = category.expenses.all()
-            if date_range:
-                start_date, end_date = self.get_date_range(date_range)
-                expenses = self.get_expenses_in_range(expenses, start_date, end_date)
-            total[category.name] = self.get_category_total(expenses)
+        start_date = end_date = None
+        if date_range:
+            start_date, end_date = self.get_date_range(date_range)
+        # named ranges move with the date, so it is part of the key
+        total = stats_cache.get_or_compute(
+            request.user.pk,
+            f"expense-stats:single:{date.today()}:{(date_range or '').lower()}",
+            lambda: self.get_category_totals(request.user, start_date, end_date),
+        )
 
         return Response({"Category Data": total})
 
+    def get_many(self, request):
+        labels = [label.strip() for label in request.query_params["ranges"].split(",")]
+        ranges = {}
+        for label in filter(None, labels):
+            window = self.parse_range(label)
+            if window is None:
+                return Response(
+                    {
+                        "error": f"Invalid range '{label}'. Use 'today', 'yesterday', 'this week', "
+                        "'this month', 'last week', 'last month' or a custom range like "
+                        "'2024-01-01..2024-01-31'"
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            ranges[label] = window
+        if not ranges:
+            return Response(
+                {"error": "Provide at least one range"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ranges) > MAX_RANGES:
+            return Response(
+                {"error": f"At most {MAX_RANGES} ranges can be requested at once"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        # cached under the lowercased labels, answered with the requested ones
+        normalized = {label.lower(): window for label, window in ranges.items()}
+        totals = stats_cache.get_or_compute(
+            request.user.pk,
+            f"expense-stats:multi:{date.today()}:{','.join(normalized)}",
+            lambda: self.get_totals_per_range(request.user, normalized),
+        )
+        return Response({"Category Data": {label: totals[label.lower()] for label in ranges}})
+
+    def parse_range(self, label):
+        if label.lower() in NAMED_RANGES:
+            return self.get_date_range(label)
+        start, separator, end = label.partition("..")
+        try:
+            start_date, end_date = parse_date(start), parse_date(end)
+        except ValueError:
+            return None
+        if not separator or start_date is None or end_date is None or start_date > end_date:
+            return None
+        return start_date, end_date
+
     def get_date_range(self, date_range):
         today = date.today()
 
@@ -119,30 +195,262 @@ class ExpensesStats(APIView):
             """
             end_date = today
 
+        elif date_range.lower() in ("last week", "last month"):
+            period = date_range.lower().split()[1]
+            _, (start_date, end_date) = comparison_windows(period, today, full=True)
+
         return start_date, end_date
 
-    def get_category_total(self, expenses):
-        amount = 0
-        # amount = amount + expenses.amount for expense in expenses
-        for expense in expenses:
-            amount += expense.amount
-        return amount
-
-    def get_expenses_in_range(self, expenses, start_date, end_date):
-        data = {}
-        expenses_obj = expenses.filter(
-            created_at__lte=end_date, created_at__gte=start_date
+    def get_category_totals(self, user, start_date=None, end_date=None):
+        """
+        Sum the user's daily spend rollup per category in a single grouped query.
+        Categories without expenses in the range are kept with a total of 0.
+        """
+        in_range = None
+        if start_date is not None:
+            in_range = Q(
+                daily_spend__day__gte=start_date,
+                daily_spend__day__lte=end_date,
+            )
+        categories = Category.objects.filter(owner=user).annotate(
+            total=Coalesce(
+                Sum("daily_spend__total", filter=in_range),
+                Value(0),
+                output_field=BigIntegerField(),
+            )
         )
-        return expenses_obj
+        return {name: from_cents(total) for name, total in categories.values_list("name", "total")}
+
+    def get_totals_per_range(self, user, ranges):
+        """
+        Sum the daily spend rollup per category for several ranges
+        (label -> (start_date, end_date)) in one pass: the rollup is joined
+        once over the window covering every range, and each range is a
+        conditional sum over the joined rows.
+        """
+        window = FilteredRelation(
+            "daily_spend",
+            condition=Q(
+                daily_spend__day__gte=min(start for start, _ in ranges.values()),
+                daily_spend__day__lte=max(end for _, end in ranges.values()),
+            ),
+        )
+        totals = {
+            f"range_{i}": Coalesce(
+                Sum("spend__total", filter=Q(spend__day__gte=start, spend__day__lte=end)),
+                Value(0),
+                output_field=BigIntegerField(),
+            )
+            for i, (start, end) in enumerate(ranges.values())
+        }
+        rows = (
+            Category.objects.filter(owner=user)
+            .annotate(spend=window)
+            .annotate(**totals)
+            .values_list("name", *totals)
+        )
+
+        result = {label: {} for label in ranges}
+        for name, *amounts in rows:
+            for label, amount in zip(ranges, amounts):
+                result[label][name] = from_cents(amount)
+        return result
 
 
 class TotalExpenses(APIView):
-    serializer_class = ExpenseSerializer
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags,
+        summary="Lifetime total of expenses",
+        description="""
+            This endpoint returns the total amount and the number of expenses the user has
+            recorded since they started using the app
+            """,
+    )
+    def get(self, request):
+        total, count = stats_cache.get_or_compute(
+            request.user.pk,
+            "total-expenses",
+            lambda: UserTotal.objects.filter(owner=request.user)
+            .values_list("total", "count")
+            .first()
+            or (0, 0),
+        )
+
+        return Response(
+            {"total expenses": from_cents(total), "count": count}, status=status.HTTP_200_OK
+        )
 
+
+class SpendSeries(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags,
+        summary="Spend over time",
+        description="""
+            This endpoint returns the amount spent and the number of expenses per day, week,
+            month or year between two dates, optionally split per category. Every bucket of
+            the range is returned, with a total of 0 when nothing was spent. Weeks start on
+            Monday and each bucket is labelled with its first day
+            """,
+        parameters=[
+            OpenApiParameter(name="start_date", type=date, required=True),
+            OpenApiParameter(name="end_date", type=date, required=True),
+            OpenApiParameter(
+                name="bucket",
+                type=str,
+                required=False,
+                description="Size of each bucket (default day)",
+                enum=BUCKETS,
+            ),
+            OpenApiParameter(
+                name="group_by",
+                type=str,
+                required=False,
+                description="Return one series per category",
+                enum=["category"],
+            ),
+        ],
+    )
     def get(self, request):
-        expenses = Expense.objects.filter(owner=request.user)
-        total = 0
-        for expense in expenses:
-            total += expense.amount
+        serializer = SpendSeriesSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
 
-        return Response({"total expenses": total}, status=status.HTTP_200_OK)
+        series = spend_series(
+            request.user,
+            options["start_date"],
+            options["end_date"],
+            options["bucket"],
+            group_by=options.get("group_by"),
+        )
+        return Response(
+            {
+                "start_date": options["start_date"],
+                "end_date": options["end_date"],
+                "bucket": options["bucket"],
+                "series": series,
+            }
+        )
+
+
+class BudgetForecast(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags,
+        summary="Budget forecast",
+        description=f"""
+            This endpoint returns, for each category, the spend of the current month, the
+            average daily spend over the last 7 and 28 days and the trend of the daily spend
+            over the last {LOOKBACK_DAYS} days. From the trend it projects the total at the
+            end of the month and the date the category limit will be reached. `status` is
+            `at_risk` when the limit is expected to be reached before the end of the month
+            """,
+    )
+    def get(self, request):
+        today = date.today()
+        forecast = stats_cache.get_or_compute(
+            request.user.pk,
+            f"forecast:{today}",
+            lambda: budget_forecast(request.user, today),
+        )
+        return Response({"date": today, "categories": forecast})
+
+
+class PeriodComparison(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags,
+        summary="Period-over-period comparison",
+        description="""
+            This endpoint returns the amount spent and the number of expenses of the current
+            week, month or year next to the previous one, in total and per category, with
+            the absolute change and the change in percent (null when nothing was spent in the
+            previous period). The previous period is cut at the same point as the current
+            one unless `full` is true
+            """,
+        parameters=[
+            OpenApiParameter(
+                name="period",
+                type=str,
+                required=False,
+                description="Period to compare (default month)",
+                enum=PERIODS,
+            ),
+            OpenApiParameter(
+                name="full",
+                type=bool,
+                required=False,
+                description="Compare with the whole previous period",
+            ),
+        ],
+    )
+    def get(self, request):
+        serializer = PeriodComparisonSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        period, full = serializer.validated_data["period"], serializer.validated_data["full"]
+
+        today = date.today()
+        comparison = stats_cache.get_or_compute(
+            request.user.pk,
+            f"compare:{today}:{period}:{full}",
+            lambda: compare_periods(request.user, period, today, full),
+        )
+        return Response(comparison)
+
+
+class SpendAnalytics(APIView):
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=tags,
+        summary="Top expenses, top categories and expense sizes",
+        description="""
+            This endpoint returns, between two dates (the current month by default), the
+            largest expenses, the categories ranked by amount spent with their share of the
+            total, and the median and 90th percentile expense amount of each category.
+            `limit` caps the number of expenses and categories returned
+            """,
+        parameters=[
+            OpenApiParameter(name="start_date", type=date, required=False),
+            OpenApiParameter(name="end_date", type=date, required=False),
+            OpenApiParameter(
+                name="limit",
+                type=int,
+                required=False,
+                description="Number of expenses and categories to return (default 10, max 100)",
+            ),
+        ],
+    )
+    def get(self, request):
+        serializer = SpendAnalyticsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
+        analytics = stats_cache.get_or_compute(
+            request.user.pk,
+            f"analytics:{options['start_date']}:{options['end_date']}:{options['limit']}",
+            lambda: spend_analytics(
+                request.user, options["start_date"], options["end_date"], options["limit"]
+            ),
+        )
+        return Response(analytics)
+
+
+class StatsCacheInfo(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        tags=tags,
+        summary="Stats cache counters",
+        description="""
+            This endpoint returns the hit and miss counters of the stats cache of the
+            process serving the request. Only available to staff users
+            """,
+    )
+    def get(self, request):
+        return Response(stats_cache.info())